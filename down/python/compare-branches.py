@@ -10,25 +10,43 @@ The above copyright notice and this permission notice shall be included in all c
 THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 '''
 
-import sys, subprocess, getopt
-import re
-
-gitLogCmd       = ['git', 'log', '--pretty=oneline', '--no-merges', '--no-color']
-gitAuthorCmd    = ['git', 'show', '-s', '--format=(%an)', '--no-color']
-gitCommitMsgCmd = ['git', 'log', '-1', '--pretty=%B', '--no-color']
+import sys, os, subprocess, getopt
+import re, sqlite3, multiprocessing
+import random, zlib
+
+# NUL separated commitID, author, date, subject, body, and NUL after each
+gitLogCmd       = ['git', 'log', '-z', '--format=%H%x00%an%x00%aD%x00%s%x00%B',
+                   '--no-merges', '--no-color']
+gitPatchLogCmd  = ['git', 'log', '-p', '--no-color', '--no-walk=unsorted', '--stdin']
+gitPatchIdCmd   = ['git', 'patch-id', '--stable']
+gitDirCmd       = ['git', 'rev-parse', '--git-common-dir']
+gitMergeBaseCmd = ['git', 'merge-base', '--octopus']
+gitDiffsCmd     = ['git', 'log', '-p', '--no-color', '--no-walk=unsorted',
+                   '--stdin', '--format=%x00%H']
+
+cacheFileName = 'compare-branches.db'
 
 branchAOnly   = False
 branchBOnly   = False
 reversedOrder = False
+printDate     = False
+useCache      = True
+commitCache   = None
+jobs          = 1
 
 cherryPickLine = '\(cherry picked from commit '
+cherryPickRegEx = re.compile(cherryPickLine)
 
 # just a basic commit object
 class gitCommit:
-    def __init__(self, commitID, commitSubject):
+    def __init__(self, commitID, commitSubject, author="", date="",
+                 patchID=""):
         self.commitID      = commitID
         self.commitSubject = commitSubject
         self.cherryPickID  = ""
+        self.author        = author
+        self.date          = date
+        self.patchID       = patchID
 
     def getCommitID(self):
         return self.commitID
@@ -36,6 +54,16 @@ class gitCommit:
     def getCommitSubject(self):
         return self.commitSubject
 
+    def getPatchID(self):
+        return self.patchID
+
+    # '(author)', or '(author) date' with -d
+    def getCommitAuthor(self):
+        if printDate:
+            return '(%s) %s' % (self.author, self.date)
+
+        return '(%s)' % self.author
+
     def addCherryPickID(self, ID):
         self.cherryPickID = ID
 
@@ -43,6 +71,120 @@ class gitCommit:
         return self.cherryPickID
 
 
+# Commit IDs never change, so neither do their patch-id, cherry-pick
+# source, author or date. Kept in a sqlite file in the .git dir, a run only
+# computes patch-ids of commits no earlier run has seen (the rest comes
+# with the log anyway). Remove the file to start over.
+class CommitCache:
+    def __init__(self, path):
+        self.db = sqlite3.connect(path, timeout=60)
+        self.db.text_factory = str # same byte strings git gave us
+
+        self.db.execute('CREATE TABLE IF NOT EXISTS commits ('
+                        'commitID TEXT PRIMARY KEY, patchID TEXT, '
+                        'subject TEXT, cherryPickID TEXT, '
+                        'author TEXT, date TEXT)')
+
+    # returns {commitID: patchID} for the known ones
+    def lookup(self, commitIDs):
+        known = {}
+
+        # stay well below sqlite's limit of host parameters per statement
+        for i in range(0, len(commitIDs), 500):
+            chunk = commitIDs[i:i + 500]
+            rows  = self.db.execute('SELECT commitID, patchID FROM commits '
+                                    'WHERE commitID IN (%s)' %
+                                    ','.join('?' * len(chunk)), chunk)
+            for commitID, patchID in rows:
+                known[commitID] = patchID
+
+        return known
+
+    # rows of (commitID, patchID, subject, cherryPickID, author, date)
+    def addCommits(self, rows):
+        self.db.executemany('INSERT OR IGNORE INTO commits (commitID, patchID, '
+                            'subject, cherryPickID, author, date) '
+                            'VALUES (?, ?, ?, ?, ?, ?)', rows)
+        self.db.commit()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+
+def openCommitCache():
+    gitDir = subprocess.check_output(gitDirCmd).rstrip('\n')
+    return CommitCache(os.path.join(gitDir, cacheFileName))
+
+def searchCherryPickID(commitMsg):
+    for line in commitMsg.splitlines():
+        if cherryPickRegEx.search(line):
+            cherryPickID = cherryPickRegEx.split(line)[1]
+
+            # remove closing bracket
+            cherryPickID = re.sub('\)$', '', cherryPickID)
+
+            return cherryPickID
+
+# one 'git log -p' over all given commits piped into one 'git patch-id',
+# instead of a 'git show' and a 'git patch-id' per commit
+def startPatchIDs(commitIDs):
+    log  = subprocess.Popen(gitPatchLogCmd, stdin=subprocess.PIPE,
+                            stdout=subprocess.PIPE)
+    proc = subprocess.Popen(gitPatchIdCmd, stdin=log.stdout,
+                            stdout=subprocess.PIPE)
+    log.stdout.close() # so git log gets SIGPIPE if patch-id dies
+
+    # git reads all of --stdin before it writes anything
+    log.stdin.write('\n'.join(commitIDs) + '\n')
+    log.stdin.close()
+
+    return (log, proc)
+
+def readPatchIDs(pipeline):
+    log, proc = pipeline
+    patchIDs  = {}
+
+    # '<patch-id> <commit-id>' per line as git log goes, commits
+    # without a diff get no line
+    for line in iter(proc.stdout.readline, ''):
+        patchID, commitID = line.split()
+        patchIDs[commitID] = patchID
+
+    proc.wait()
+    if log.wait() != 0:
+        raise subprocess.CalledProcessError(log.returncode, gitPatchLogCmd)
+
+    return patchIDs
+
+# patch-id of each commit, runs in a -j worker
+def computeCommits(commitIDs):
+    return readPatchIDs(startPatchIDs(commitIDs) )
+
+# with -j, commitIDs are split in contiguous chunks, each worker runs its
+# own git pipeline. Results are keyed by commitID, callers walk their own
+# commit list, so output order does not depend on which worker ends first.
+def computeNewCommits(commitIDs):
+    if jobs <= 1 or len(commitIDs) < 2 * jobs:
+        return computeCommits(commitIDs)
+
+    size   = (len(commitIDs) + jobs - 1) / jobs
+    chunks = [commitIDs[i:i + size] for i in range(0, len(commitIDs), size)]
+
+    pool = multiprocessing.Pool(jobs)
+    try:
+        results = pool.map(computeCommits, chunks)
+    finally:
+        pool.close()
+        pool.join()
+
+    computed = {}
+    for result in results:
+        computed.update(result)
+
+    return computed
+
+
 class Branch:
     def __init__(self, branchName):
         self.branchName = branchName
@@ -50,60 +192,70 @@ class Branch:
         self.commitList     = []  # list of git commit ids
         self.commitObjDict  = {}  # list of gitCommit objects
         self.missingDict    = {} # list of missing commitIDs of this branch
+        self.fuzzyDict      = {} # missing commitID -> our look-alike commit
 
-    def searchCherryPickID(self, commitID):
-        commitMsg = subprocess.check_output(gitCommitMsgCmd + [commitID])
-
-        searchRegEx  = re.compile(cherryPickLine)
-
-        for line in commitMsg.splitlines():
-            if searchRegEx.search(line):
-                cherryPickID = searchRegEx.split(line)[1]
-
-                # remove closing bracket
-                cherryPickID = re.sub('\)$', '', cherryPickID)
+    def addCommit(self, commitID, commitSubject, patchID, cherryPickID,
+                  author, date):
 
-                return cherryPickID
+        commitObj = gitCommit(commitID, commitSubject, author, date, patchID)
 
-    def addCommit(self, commitID, commitSubject):
-
-        commitObj = gitCommit(commitID, commitSubject)
-
-        gitShow = subprocess.check_output(['git', 'show', commitID])
-        proc = subprocess.Popen(['git', 'patch-id'], stdout=subprocess.PIPE, stdin=subprocess.PIPE)
-        patchID = proc.communicate(input=gitShow)[0].split(' ')[0]
-
-        commitObj.addCherryPickID(self.searchCherryPickID(commitID) )
+        commitObj.addCherryPickID(cherryPickID)
         # print self.branchName + ': Adding: ' + patchID + ' : ' + commitID
 
         self.commitList.append(commitID)
         self.commitObjDict[commitID] = commitObj
         self.patchIdDict[patchID]    = commitID
 
-    def addLogLine(self, logLine):
-        commitID      = logLine[:40]
-        commitSubject = logLine[41:]
-        self.addCommit(commitID, commitSubject)
-
+    # one pass over the log gives every commit's metadata, no git process
+    # per commit for its message or author
     def addGitLog(self, logOutput):
-        lines = logOutput.split('\n')
-        if lines[-1] == '':
-            lines.pop()
-
-        for line in lines:
-            self.addLogLine(line)
-
+        fields  = logOutput.split('\0')
+        commits = [fields[i:i + 5] for i in range(0, len(fields) - 4, 5)]
+
+        known = {}
+        if commitCache:
+            known = commitCache.lookup([commit[0] for commit in commits])
+
+        newIDs   = [commit[0] for commit in commits if commit[0] not in known]
+        computed = {}
+        if newIDs:
+            computed = computeNewCommits(newIDs)
+
+        newRows = []
+        for commitID, author, date, commitSubject, commitMsg in commits:
+            cherryPickID = searchCherryPickID(commitMsg) or ''
+
+            if commitID in known:
+                patchID = known[commitID]
+            else:
+                # empty commits share the empty patch-id, as 'git patch-id'
+                # on their 'git show' used to give
+                patchID = computed.get(commitID, '')
+                newRows.append( (commitID, patchID, commitSubject, cherryPickID,
+                                 author, date) )
+
+            self.addCommit(commitID, commitSubject, patchID, cherryPickID,
+                           author, date)
+
+        if commitCache and newRows:
+            commitCache.addCommits(newRows)
+
+    # comparedBranchName of None walks the whole history, as -e does
     def doComparedBranchLog(self, comparedBranchName):
-        cmd = gitLogCmd + [self.branchName]
+        revArgs = [self.branchName]
 
         if 'logSinceTime' in globals():
-            cmd.append('--since="%s"' % logSinceTime)
-        elif not 'exactSearch' in globals():
-            cmd.append('^' + comparedBranchName)
+            revArgs.append('--since="%s"' % logSinceTime)
+        elif comparedBranchName and not 'exactSearch' in globals():
+            revArgs.append('^' + comparedBranchName)
 
-        # print 'Compared branch log: ' + str(cmd)
+        # no --author for -f here: a branch's commits are also what the
+        # other branch is matched against, whoever committed them. -f is
+        # applied on print, from the author the log already gave.
 
-        log = subprocess.check_output(cmd );
+        # print 'Compared branch log: ' + str(gitLogCmd + revArgs)
+
+        log = subprocess.check_output(gitLogCmd + revArgs);
 
         self.addGitLog(log)
 
@@ -133,9 +285,8 @@ class Branch:
 
         for commitID in comparisonCommitList:
             if self.isCommitInMissingDict(commitID):
-                cmd          = gitAuthorCmd + [commitID]
-                commitAuthor = subprocess.check_output(cmd).rstrip()
                 commitObj    = comparisonCommitDict[commitID]
+                commitAuthor = commitObj.getCommitAuthor()
 
                 cherryPickID = commitObj.getCherryPickID()
                 if (cherryPickID and (cherryPickID in self.commitObjDict) ):
@@ -149,6 +300,9 @@ class Branch:
 
                 if doPrint:
 
+                    if commitID in self.fuzzyDict:
+                        continue # probably applied with conflicts
+
                     if 'filterAuthor' in globals() and \
                         not re.search(filterAuthor, commitAuthor):
                             continue # a different owner
@@ -159,6 +313,23 @@ class Branch:
         if doPrint:
             print
 
+    # commits the print pass would list, before the author filter
+    def getMissingCommits(self, comparisonCommitList, comparisonCommitDict):
+        missing = []
+
+        for commitID in comparisonCommitList:
+            if not self.isCommitInMissingDict(commitID):
+                continue
+
+            cherryPickID = comparisonCommitDict[commitID].getCherryPickID()
+            if not (cherryPickID and (cherryPickID in self.commitObjDict) ):
+                missing.append(commitID)
+
+        return missing
+
+    def addFuzzyMatch(self, commitID, ourCommitID):
+        self.fuzzyDict[commitID] = ourCommitID
+
     def printMissingCommits(self, comparisonCommitList, comparisonCommitDict):
         self.iterateMissingCommits(comparisonCommitList, comparisonCommitDict, True)
 
@@ -175,12 +346,236 @@ class Branch:
     def getCommitObjDict(self):
         return self.commitObjDict
 
+
+# Matrix mode (-m): each branch is logged and patch-id'ed once, against the
+# common base of all branches, instead of once per pair. Commits are then
+# grouped across branches: same patch-id, or one cherry-picked from the
+# other, is one change. A change not on every branch gets a row showing
+# which branches have it.
+def matrixBase(branchNames):
+    try:
+        return subprocess.check_output(gitMergeBaseCmd + branchNames).split()[0]
+    except (subprocess.CalledProcessError, IndexError):
+        return None # unrelated histories, walk them all
+
+def groupCommits(branchObjs):
+    parent = {}
+
+    def find(commitID):
+        while parent[commitID] != commitID:
+            parent[commitID] = parent[parent[commitID] ]
+            commitID = parent[commitID]
+        return commitID
+
+    def union(commitA, commitB):
+        parent[find(commitA)] = find(commitB)
+
+    for branchObj in branchObjs:
+        for commitID in branchObj.getCommitList():
+            parent.setdefault(commitID, commitID)
+
+    # every commit of a patch-id, not only the one patchIdDict keeps, so
+    # a patch applied twice on a branch is not missing anywhere it is
+    patchOwner = {}
+    for branchObj in branchObjs:
+        commitObjDict = branchObj.getCommitObjDict()
+        for commitID in branchObj.getCommitList():
+            commitObj = commitObjDict[commitID]
+            union(commitID,
+                  patchOwner.setdefault(commitObj.getPatchID(), commitID) )
+
+            cherryPickID = commitObj.getCherryPickID()
+            if cherryPickID in parent:
+                union(commitID, cherryPickID)
+
+    return find
+
+def compareMatrix(branchNames):
+    base       = matrixBase(branchNames)
+    branchObjs = []
+
+    for branchName in branchNames:
+        branchObj = Branch(branchName)
+        # a missing base is like -e, whole history of each branch
+        branchObj.doComparedBranchLog(base)
+        branchObjs.append(branchObj)
+
+    find = groupCommits(branchObjs)
+
+    # group -> set of branch indexes having it
+    presence = {}
+    for index, branchObj in enumerate(branchObjs):
+        for commitID in branchObj.getCommitList():
+            presence.setdefault(find(commitID), set() ).add(index)
+
+    # pairwise missing counts come from the same groups, missing[i][j] is
+    # changes on branch j that branch i lacks
+    nBranches = len(branchObjs)
+    missing   = [[0] * nBranches for i in range(nBranches)]
+
+    print 'Branches:'
+    for index, branchName in enumerate(branchNames):
+        print '  %d %s' % (index, branchName)
+    print
+    print '  %-40s %s' % ('commit', ' '.join(str(i % 10) for i in range(nBranches)))
+
+    # Note: rows in the order of the branches given and their commitList
+    done = set()
+    for branchObj in branchObjs:
+        commitObjDict = branchObj.getCommitObjDict()
+
+        for commitID in branchObj.getCommitList():
+            group = find(commitID)
+            if group in done:
+                continue
+            done.add(group)
+
+            have = presence[group]
+            if len(have) == nBranches:
+                continue
+
+            for i in range(nBranches):
+                for j in have:
+                    if i not in have:
+                        missing[i][j] += 1
+
+            commitAuthor = commitObjDict[commitID].getCommitAuthor()
+            if 'filterAuthor' in globals() and \
+                not re.search(filterAuthor, commitAuthor):
+                    continue # a different owner
+
+            marks = ' '.join('x' if i in have else '.' for i in range(nBranches))
+            print '  %s %s %s %s' % \
+                (commitID, marks, commitAuthor,
+                 commitObjDict[commitID].getCommitSubject() )
+
+    print
+    print 'Missing from (row) but present on (column):'
+    print '    ' + ''.join('%7d' % i for i in range(nBranches))
+    for i in range(nBranches):
+        print '  %d ' % i + ''.join('%7d' % count for count in missing[i])
+    print
+
+# Fuzzy stage (-z): backports with resolved conflicts get a different
+# patch-id, so they show up as missing on both sides. Each missing commit
+# gets a MinHash signature of its changed lines; LSH bands only bring up
+# commits sharing a band as candidates, as does the same subject, so diffs
+# are never compared all against all. Score is the estimated Jaccard
+# similarity of the changed lines, raised half way to 1 on same subject.
+minHashPrime = (1 << 61) - 1
+minHashBands = 16
+minHashRows  = 4
+
+rng          = random.Random(20131)  # same signatures every run
+minHashSeeds = [(rng.randrange(1, minHashPrime), rng.randrange(minHashPrime))
+                for i in range(minHashBands * minHashRows)]
+
+subjectTagRegEx = re.compile('^(\s*\[[^]]*\])+')
+
+def normSubject(subject):
+    return ' '.join(subjectTagRegEx.sub('', subject).lower().split() )
+
+# changed lines of each commit, from one 'git log -p' over all of them
+def getChangedLines(commitIDs):
+    proc = subprocess.Popen(gitDiffsCmd, stdin=subprocess.PIPE,
+                            stdout=subprocess.PIPE)
+    diffs = proc.communicate('\n'.join(commitIDs) + '\n')[0]
+
+    changedLines = {}
+    for diff in diffs.split('\0')[1:]:
+        lines = diff.split('\n')
+        changed = set()
+        for line in lines[1:]:
+            if line[:1] in ('+', '-') and line[:4] not in ('+++ ', '--- '):
+                # whitespace is often what a conflict resolution changed
+                changed.add(line[0] + ' '.join(line[1:].split() ) )
+        changedLines[lines[0] ] = changed
+
+    return changedLines
+
+def minHash(changed):
+    hashes = [zlib.crc32(line) & 0xffffffff for line in changed]
+    if not hashes:
+        return None
+
+    return [min( (a * h + b) % minHashPrime for h in hashes)
+            for a, b in minHashSeeds]
+
+def fuzzyScore(sigA, sigB, sameSubject):
+    similar = 0.0
+    if sigA and sigB:
+        similar = sum(1 for x, y in zip(sigA, sigB) if x == y) / float(len(sigA) )
+
+    if sameSubject:
+        return (similar + 1) / 2
+
+    return similar
+
+# pairs of (commitA, commitB, score) of missingA and missingB commits that
+# are probably the same change, each commit in one pair at most
+def fuzzyMatch(missingA, subjectsA, missingB, subjectsB, minScore):
+    changedLines = getChangedLines(missingA + missingB)
+    sigs = {}
+    for commitID in missingA + missingB:
+        sigs[commitID] = minHash(changedLines.get(commitID, () ) )
+
+    # candidates: same normalized subject, or same band of signature
+    buckets = {}
+    for side, missing, subjects in ((0, missingA, subjectsA),
+                                    (1, missingB, subjectsB) ):
+        for commitID in missing:
+            keys = [('subject', normSubject(subjects[commitID]) )]
+            sig  = sigs[commitID]
+            if sig:
+                for band in range(minHashBands):
+                    rows = sig[band * minHashRows:(band + 1) * minHashRows]
+                    keys.append( (band, tuple(rows) ) )
+            for key in keys:
+                buckets.setdefault(key, ([], []) )[side].append(commitID)
+
+    indexA = dict( (commitID, i) for i, commitID in enumerate(missingA) )
+    indexB = dict( (commitID, i) for i, commitID in enumerate(missingB) )
+
+    candidates = set()
+    for commitsA, commitsB in buckets.values():
+        for commitA in commitsA:
+            for commitB in commitsB:
+                candidates.add( (commitA, commitB) )
+
+    scored = []
+    for commitA, commitB in candidates:
+        sameSubject = normSubject(subjectsA[commitA]) == \
+            normSubject(subjectsB[commitB])
+        score = fuzzyScore(sigs[commitA], sigs[commitB], sameSubject)
+        if score >= minScore:
+            scored.append( (-score, indexA[commitA], indexB[commitB],
+                            commitA, commitB) )
+
+    # best scores first, ties in commitList order, so the result is stable
+    pairs = []
+    used  = set()
+    for negScore, i, j, commitA, commitB in sorted(scored):
+        if commitA in used or commitB in used:
+            continue
+        used.add(commitA)
+        used.add(commitB)
+        pairs.append( (i, commitA, commitB, -negScore) )
+
+    return [(commitA, commitB, score) for i, commitA, commitB, score in sorted(pairs)]
+
+def subjectsOf(commitIDs, commitObjDict):
+    return dict( (commitID, commitObjDict[commitID].getCommitSubject() )
+                 for commitID in commitIDs)
+
 def usage():
         print '''
         Usage:
 
           -h
                 Print this help message.
+          -n
+                Do not use or update the cache of patch-ids and authors
+                (%s in the .git dir).
           -a <branch-name> 
                 The name of branch a.
           -b <branch-name>
@@ -189,6 +584,10 @@ def usage():
                 List commits missing from branch a only.
           -B
                 List commits missing from branch b only.
+          -m <branch-name,branch-name,...>
+                Matrix mode, instead of -a and -b. Every patch-id is computed
+                once per branch, and commits not on all of the branches are
+                listed with the branches having them (x) or not (.).
           -d
                 Print the date when the commit was created.
           -e
@@ -197,15 +596,23 @@ def usage():
                 merges between branches.
           -f
                 Only print commits created by this user.
+          -z <min-score>
+                Pair up missing commits that are probably the same change
+                applied with conflicts (similar diff, or same subject), with
+                a score from 0 to 1. Pairs scoring at least min-score (say
+                0.6) are listed apart, not as missing.
+          -j <jobs>
+                Compute patch-ids of (uncached) commits in these many
+                processes, useful with -e on big branches.
           -r
                 Print in reverse order (older (top) to newer (bottom) ).
           -t
                 How far back in time to go (passed to git log as --since) i.e. '1 month ago'.
-        '''
+        ''' % cacheFileName
 
 
 try:
-    opts, args = getopt.getopt(sys.argv[1:], "ha:b:BAdef:rt:")
+    opts, args = getopt.getopt(sys.argv[1:], "ha:b:BAdef:j:m:nrt:z:")
 except:
     usage()
     sys.exit()
@@ -224,19 +631,30 @@ for opt,arg in opts:
     if opt == '-B':
         branchBOnly = True
     if opt == '-d':
-        # mis-use the author command and add the commit date
-        gitAuthorCmd[3] = '--format=(%an) %aD'
+        printDate = True
     if opt == '-e':
         exactSearch = True
     if opt == '-f':
         filterAuthor = arg
+    if opt == '-j':
+        jobs = int(arg)
+    if opt == '-m':
+        matrixBranches = arg.split(',')
+    if opt == '-n':
+        useCache = False
     if opt == '-r':
         reversedOrder = True
     if opt == '-t':
         logSinceTime = arg
+    if opt == '-z':
+        fuzzyMinScore = float(arg)
 
 
-if 'branchAName' not in globals() or 'branchBName' not in globals():
+if 'matrixBranches' in globals():
+    if len(matrixBranches) < 2:
+        print 'You must specify at least two branches with -m'
+        sys.exit(1)
+elif 'branchAName' not in globals() or 'branchBName' not in globals():
     print 'You must specify two branches with -a and -b'
     sys.exit(1)
 
@@ -244,6 +662,16 @@ if reversedOrder:
     gitLogCmd += ['--reverse']
 
 
+if useCache:
+    commitCache = openCommitCache()
+
+if 'matrixBranches' in globals():
+    compareMatrix(matrixBranches)
+
+    if commitCache:
+        commitCache.close()
+    sys.exit(0)
+
 branchAObj = Branch(branchAName)
 branchBObj = Branch(branchBName)
 
@@ -261,6 +689,21 @@ branchAObj.reverseAssignCherryPickIDs(branchBObj.getCommitList(), \
 branchBObj.reverseAssignCherryPickIDs(branchAObj.getCommitList(), \
     branchAObj.getCommitObjDict() )
 
+# missingOnA are commits of branch b that branch a lacks, and vice versa
+if 'fuzzyMinScore' in globals():
+    missingOnA = branchAObj.getMissingCommits(branchBObj.getCommitList(), \
+        branchBObj.getCommitObjDict() )
+    missingOnB = branchBObj.getMissingCommits(branchAObj.getCommitList(), \
+        branchAObj.getCommitObjDict() )
+
+    fuzzyPairs = fuzzyMatch(missingOnB, \
+        subjectsOf(missingOnB, branchAObj.getCommitObjDict() ), missingOnA, \
+        subjectsOf(missingOnA, branchBObj.getCommitObjDict() ), fuzzyMinScore)
+
+    for commitA, commitB, score in fuzzyPairs:
+        branchAObj.addFuzzyMatch(commitB, commitA)
+        branchBObj.addFuzzyMatch(commitA, commitB)
+
 #print
 
 if not branchBOnly:
@@ -271,11 +714,17 @@ if not branchAOnly:
     branchBObj.printMissingCommits(branchAObj.getCommitList(), \
         branchAObj.getCommitObjDict() )
 
-#if not branchBOnly and not branchAOnly:
-#    print
-#    print "Commits that can be probably ignored due to merge conflicts: "
-#    for msg in branch1_commit_msg:
-#        if msg in branch2_commit_msg:
-#            print '  ' + msg
+if 'fuzzyMinScore' in globals():
+    print "Commits that can be probably ignored due to merge conflicts " \
+        "(%s, %s, score):" % (branchAName, branchBName)
+
+    commitObjDict = branchAObj.getCommitObjDict()
+    for commitA, commitB, score in fuzzyPairs:
+        print '  %s %s %.2f %s' % \
+            (commitA, commitB, score, commitObjDict[commitA].getCommitSubject() )
+    print
+
+if commitCache:
+    commitCache.close()
 
 
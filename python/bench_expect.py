@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+#  DETAILS: Micro-benchmark of SSHConnect.expect() pattern handling.
+#  CREATED: 18/Oct/2026 19:20:00 IST
+# MODIFIED: 18/Oct/2026 19:20:00 IST
+#
+#   AUTHOR: Ravikiran K.S., ravikirandotks@gmail.com
+#  LICENCE: Copyright (c) 2013, Ravikiran K.S.
+
+# Always leave the code you're editing a little better than you found it
+
+# Compares SSHConnect with cached, precompiled pattern lists against the old
+# compile-per-call behaviour (SSHConnect.cache_pats = False). Two numbers are
+# reported per mode:
+#   prep  - cost of building + compiling pattern list, no I/O involved
+#   cmd   - round trip of one send_exp() to a local shell standing in for switch
+#
+# $ bench_expect.py -n 2000
+
+# Import all required modules
+import time, os, sys
+ppath = os.getenv('UTL_SCRPTS', default = os.getenv('HOME') + "/scripts/utils")
+sys.path.insert(0, ppath + "/python")
+import argparse, logging, globs, utils
+from utils import Logger
+from utils import SSHConnect
+
+class ShellConnect(SSHConnect):
+    # local bash with a switch like prompt, instead of ssh to a real switch
+    def connect(self, c = None):
+        cmd = "env PS1='admin@bench:~$ ' bash --norc --noprofile"
+        return super(ShellConnect, self).connect(cmd)
+
+def parse_args():
+    global g_args
+
+    parser = argparse.ArgumentParser(usage=__doc__)
+    parser.add_argument("-n", "--count", type = int, default = 2000,
+                        help="iterations per measurement")
+    parser.add_argument("-e", "--expr", default = None,
+                        help="extra pattern passed to expect() as expr")
+    g_args = parser.parse_args()
+
+def bench_prep(conn, cache, count, expr):
+    SSHConnect.cache_pats = cache
+    SSHConnect.pat_cache.clear()
+    start = time.perf_counter()
+    for i in range(count):
+        conn.expect_pats(expr = expr)
+    return (time.perf_counter() - start) / count
+
+def bench_cmd(conn, cache, count, expr):
+    SSHConnect.cache_pats = cache
+    SSHConnect.pat_cache.clear()
+    start = time.perf_counter()
+    for i in range(count):
+        conn.send_exp('true', expr = expr)
+    return (time.perf_counter() - start) / count
+
+def main():
+    global g_args
+
+    globs.init_vars(os.path.splitext(os.path.basename(__file__))[0])
+    parse_args()
+    # keep logger quiet, its tty I/O would dwarf what is being measured
+    globs.g_logger = Logger(logName = globs.g_script_name,
+                            ttyLvl = logging.CRITICAL + 1)
+    conn = ShellConnect('bench', timeout = 10, quiet = True)
+    if not conn.is_up():
+        globs.die("Could not start local shell")
+    conn.handle.delaybeforesend = None  # 50ms sleep per send hides the rest
+
+    print("%-8s %14s %14s" % ('mode', 'prep (usec)', 'cmd (usec)'))
+    res = {}
+    for cache in (False, True):
+        prep = bench_prep(conn, cache, g_args.count, g_args.expr)
+        cmd = bench_cmd(conn, cache, g_args.count // 10 or 1, g_args.expr)
+        res[cache] = (prep, cmd)
+        print("%-8s %14.2f %14.2f" % ('cached' if cache else 'uncached',
+                                      prep * 1e6, cmd * 1e6))
+    saved = res[False][0] - res[True][0]
+    print("saving per cmd: %.2f usec (%.1fx faster pattern prep)" %
+          (saved * 1e6, res[False][0] / max(res[True][0], 1e-9)))
+    conn.close()
+    sys.exit(0)
+
+# Standard boilerplate code to call main()
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+#  DETAILS: Benchmark of pexpect session layer (utils.SSHConnect) against
+#           local fake devices, no switches needed.
+#  CREATED: 18/Oct/2026 19:45:00 IST
+# MODIFIED: 18/Oct/2026 19:45:00 IST
+#
+#   AUTHOR: Ravikiran K.S., ravikirandotks@gmail.com
+#  LICENCE: Copyright (c) 2013, Ravikiran K.S.
+
+# Always leave the code you're editing a little better than you found it
+
+# Every session runs fakedev.py under a pty in place of ssh. Tests:
+#   connect   login dialogue (host key + password), sequential
+#   pconnect  same, -j sessions in parallel threads
+#   cmd       short cmds on one session
+#   vsh       short cmds on vsh prompt
+#   huge      one big output, via send_exp() and send_stream()
+#   slow      cmd on a device that is slow to show prompt
+#   hang      cmd that never returns, must fail after -T secs
+#   idle      silent cmd with idle detection on, must be Ctrl-C'ed after -T/2
+#             secs and leave session in sync for next cmd
+#   memory    RSS per open session, this process + fake device
+#   exec      cmds on in-process ssh (ParamikoConnect + fakesshd.FakeSSHD),
+#             one after other & -j exec channels in parallel on one transport
+# Run before rolling out changes to utils.py and compare with last numbers.
+#
+# $ bench_session.py -n 50 -c 500 -j 16
+
+# Import all required modules
+import time, os, sys
+ppath = os.getenv('UTL_SCRPTS', default = os.getenv('HOME') + "/scripts/utils")
+sys.path.insert(0, ppath + "/python")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import argparse, logging, globs, utils
+from concurrent.futures import ThreadPoolExecutor
+from utils import Logger
+from utils import SSHConnect
+from utils import ParamikoConnect
+
+FAKEDEV = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fakedev.py')
+
+class FakeConnect(SSHConnect):
+    dev_args = '-k -p secret'
+
+    def connect(self, c = None):
+        cmd = '%s %s -n %s %s' % (sys.executable, FAKEDEV, self.host,
+                                  self.dev_args)
+        if super(FakeConnect, self).connect(cmd) is False:
+            return False
+        if g_args.nodelay is True:
+            self.handle.delaybeforesend = None
+        return True
+
+def parse_args():
+    global g_args
+
+    parser = argparse.ArgumentParser(usage=__doc__)
+    parser.add_argument("-n", "--sessions", type = int, default = 20,
+                        help="sessions for connect/memory tests")
+    parser.add_argument("-c", "--cmds", type = int, default = 200,
+                        help="cmds for cmd/vsh tests")
+    parser.add_argument("-j", "--jobs", type = int, default = 8,
+                        help="parallel threads for pconnect test")
+    parser.add_argument("-L", "--lines", type = int, default = 200000,
+                        help="lines of output for huge test")
+    parser.add_argument("-T", "--timeout", type = float, default = 2,
+                        help="expect timeout for hang test")
+    parser.add_argument("-t", "--tests", default = None,
+                        help="comma separated tests to run, default all")
+    parser.add_argument("--nodelay", action = "store_true",
+                        help="drop pexpect's 50ms delay before each send")
+    g_args = parser.parse_args()
+
+def pct(samples, p):
+    if not samples:
+        return 0
+    samples = sorted(samples)
+    return samples[int(round(p * (len(samples) - 1)))]
+
+def rss(pid = 'self'):
+    # resident set size in bytes, linux only
+    try:
+        with open('/proc/%s/statm' % (pid)) as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return 0
+
+def report(name, count, secs, lat, extra = ''):
+    print("%-9s %7d %10.1f %9.2f %9.2f  %s" %
+          (name, count, count / secs if secs else 0, pct(lat, 0.5) * 1e3,
+           pct(lat, 0.99) * 1e3, extra))
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    ret = fn(*args)
+    return ret, time.perf_counter() - start
+
+def login(host):
+    return timed(lambda: FakeConnect(host, passwd = 'secret', timeout = 30,
+                                     quiet = True))
+
+def test_connect():
+    lat = []
+    start = time.perf_counter()
+    for i in range(g_args.sessions):
+        conn, secs = login('dev%d' % (i))
+        if not conn.connected or not conn.is_up():
+            globs.die("login to fake device failed")
+        lat.append(secs)
+        conn.close()
+    report('connect', len(lat), time.perf_counter() - start, lat)
+
+def test_pconnect():
+    def one(i):
+        conn, secs = login('dev%d' % (i))
+        ok = conn.connected and conn.is_up()
+        conn.close()
+        return secs if ok else None
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers = g_args.jobs) as pool:
+        lat = list(pool.map(one, range(g_args.sessions)))
+    secs = time.perf_counter() - start
+    fails = lat.count(None)
+    lat = [l for l in lat if l is not None]
+    report('pconnect', len(lat), secs, lat, 'jobs %d, %d failed' %
+           (g_args.jobs, fails))
+
+def run_cmds(name, isvsh):
+    conn, secs = login('dev0')
+    if isvsh is True:
+        conn.send_exp('cli', isvsh = True)
+    lat = []
+    start = time.perf_counter()
+    for i in range(g_args.cmds):
+        ok, secs = timed(conn.send_exp, 'echo %d' % (i), None, isvsh)
+        if ok is False:
+            globs.die("cmd on fake device failed")
+        lat.append(secs)
+    report(name, len(lat), time.perf_counter() - start, lat)
+    conn.close()
+
+def test_cmd():
+    run_cmds('cmd', False)
+
+def test_vsh():
+    run_cmds('vsh', True)
+
+def test_huge():
+    conn, secs = login('dev0')
+    mb = g_args.lines * 80 / 1e6
+    base = rss()
+    ok, secs = timed(conn.send_exp, 'huge %d' % (g_args.lines))
+    report('huge', 1, secs, [secs], '%.1f MB/s send_exp, rss +%.1f MB' %
+           (mb / secs, (rss() - base) / 1e6))
+    nlines = 0
+    start = time.perf_counter()
+    for line in conn.send_stream('huge %d' % (g_args.lines), lines = True):
+        nlines += 1
+    secs = time.perf_counter() - start
+    report('stream', 1, secs, [secs], '%.1f MB/s send_stream, %d lines' %
+           (mb / secs, nlines))
+    conn.close()
+
+def test_slow():
+    FakeConnect.dev_args = '-p secret -d 0.2'
+    conn, secs = login('dev0')
+    lat = []
+    start = time.perf_counter()
+    for i in range(5):
+        ok, secs = timed(conn.send_exp, 'echo slow')
+        lat.append(secs)
+    report('slow', len(lat), time.perf_counter() - start, lat,
+           'device waits 200ms per prompt')
+    conn.close()
+    FakeConnect.dev_args = '-k -p secret'
+
+def test_hang():
+    conn, secs = login('dev0')
+    conn.timeout = g_args.timeout
+    ok, secs = timed(conn.send_exp, 'hang')
+    report('hang', 1, secs, [secs], 'expect %s after %.1fs (timeout %.1fs)' %
+           ('failed' if ok is False else 'PASSED?', secs, g_args.timeout))
+    conn.close()
+
+def test_idle():
+    conn, secs = login('dev0')
+    conn.timeout = g_args.timeout
+    ok, secs = timed(lambda: conn.send_exp('slow %f' % (g_args.timeout * 2),
+                                           idle = g_args.timeout / 2))
+    sync = conn.send_exp('echo insync') is True and 'insync' in conn.output()
+    report('idle', 1, secs, [secs], 'expect %s after %.1fs, session %s' %
+           ('failed' if ok is False else 'PASSED?', secs,
+            'in sync' if sync else 'OUT OF SYNC'))
+    conn.close()
+
+def test_memory():
+    base = rss()
+    conns = []
+    start = time.perf_counter()
+    for i in range(g_args.sessions):
+        conns.append(login('dev%d' % (i))[0])
+    secs = time.perf_counter() - start
+    mine = (rss() - base) / max(len(conns), 1)
+    devs = sum(rss(c.handle.pid) for c in conns) / max(len(conns), 1)
+    report('memory', len(conns), secs, [], '%.1f KB/session here, %.1f MB per '
+           'fake device' % (mine / 1e3, devs / 1e6))
+    for conn in conns:
+        conn.close()
+
+def test_exec():
+    from fakesshd import FakeSSHD
+    try:
+        sshd = FakeSSHD(passwd = 'secret')
+    except ImportError as e:
+        report('exec', 0, 0, [], 'skipped: %s' % (e))
+        return
+    port = sshd.start()
+    conn, secs = timed(lambda: ParamikoConnect('127.0.0.1', passwd = 'secret',
+                                               port = port, timeout = 30,
+                                               quiet = True))
+    if not conn.connected:
+        globs.die("login to fake sshd failed")
+    report('execlogin', 1, secs, [secs])
+    lat = []
+    start = time.perf_counter()
+    for i in range(g_args.cmds):
+        ok, secs = timed(conn.send_exp, 'echo %d' % (i))
+        if ok is False:
+            globs.die("exec on fake sshd failed")
+        lat.append(secs)
+    report('exec', len(lat), time.perf_counter() - start, lat)
+    cmds = ['echo %d' % (i) for i in range(g_args.cmds)]
+    res, secs = timed(conn.exec_many, cmds, g_args.jobs)
+    fails = sum(1 for r in res if r[1] != 0)
+    report('pexec', len(res), secs, [], 'jobs %d, %d failed' %
+           (g_args.jobs, fails))
+    conn.close()
+    sshd.stop()
+
+TESTS = ['connect', 'pconnect', 'cmd', 'vsh', 'huge', 'slow', 'hang', 'idle',
+         'memory', 'exec']
+
+def main():
+    global g_args
+
+    globs.init_vars(os.path.splitext(os.path.basename(__file__))[0])
+    parse_args()
+    # keep logger quiet, its tty I/O would dwarf what is being measured
+    globs.g_logger = Logger(logName = globs.g_script_name,
+                            ttyLvl = logging.CRITICAL + 1)
+    tests = TESTS if g_args.tests is None else g_args.tests.split(',')
+    print("%-9s %7s %10s %9s %9s  %s" % ('test', 'count', 'ops/sec',
+                                         'p50 ms', 'p99 ms', 'notes'))
+    for name in tests:
+        globals()['test_' + name]()
+    sys.exit(0)
+
+# Standard boilerplate code to call main()
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+#  DETAILS: Startup (import) time of scripts in python/ dir.
+#  CREATED: 18/Oct/2026 20:30:00 IST
+# MODIFIED: 18/Oct/2026 20:30:00 IST
+#
+#   AUTHOR: Ravikiran K.S., ravikirandotks@gmail.com
+#  LICENCE: Copyright (c) 2013, Ravikiran K.S.
+
+# Always leave the code you're editing a little better than you found it
+
+# Runs each script with --help in a fresh interpreter, -n times, and reports
+# wall time of whole run (nearly all of it is imports for --help). With -i,
+# also lists modules that cost most to import, from python -X importtime.
+# Run after touching imports of a script or utils/globs, and compare with
+# last numbers. Heavy modules should be loaded lazily, see globs.lazy_import()
+# With PYTHONDONTWRITEBYTECODE set, every run also compiles utils.py afresh.
+#
+# $ bench_startup.py -n 20 -i 5
+# $ bench_startup.py -s ssh.py,scapy.py
+
+# Import all required modules
+import time, os, sys, subprocess
+import argparse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# scripts find globs/utils via $UTL_SCRPTS, else utils dir of this checkout
+PPATH = os.getenv('UTL_SCRPTS', default = os.path.join(os.path.dirname(HERE),
+                                                       'utils'))
+SCRIPTS = ['ssh.py', 'telnet.py', 'scapy.py', 'netmiko_test.py', 'fakedev.py',
+           'bench_expect.py', 'bench_session.py']
+
+def parse_args():
+    global g_args
+
+    parser = argparse.ArgumentParser(usage=__doc__)
+    parser.add_argument("-n", "--runs", type = int, default = 10,
+                        help="runs per script, best & median are reported")
+    parser.add_argument("-s", "--scripts", default = None,
+                        help="comma separated scripts to time, default all")
+    parser.add_argument("-i", "--imports", type = int, default = 0,
+                        help="show these many costliest imports per script")
+    g_args = parser.parse_args()
+
+def run(script, importtime = False):
+    # returns wall secs, exit status & stderr of 'script --help'
+    cmd = [sys.executable]
+    if importtime is True:
+        cmd += ['-X', 'importtime']
+    cmd += [os.path.join(HERE, script), '--help']
+    env = dict(os.environ, UTL_SCRPTS = PPATH)
+    env['PYTHONPATH'] = os.pathsep.join(p for p in (PPATH + '/python',
+                                        os.getenv('PYTHONPATH')) if p)
+    start = time.perf_counter()
+    proc = subprocess.run(cmd, stdout = subprocess.DEVNULL,
+                          stderr = subprocess.PIPE, env = env)
+    return time.perf_counter() - start, proc.returncode, proc.stderr.decode()
+
+def top_imports(stderr, count):
+    # lines are "import time: self | cumulative | <indent>module"
+    costs = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        try:
+            costs.append((int(fields[1]), fields[2][1:]))
+        except (IndexError, ValueError):
+            continue                    # header line
+    # top level imports only, nested ones are part of their cumulative time
+    tops = [(us, name) for us, name in costs if not name.startswith(' ')]
+    return sorted(tops, reverse = True)[:count]
+
+def main():
+    global g_args
+
+    parse_args()
+    scripts = SCRIPTS if g_args.scripts is None else g_args.scripts.split(',')
+    print("%-18s %10s %10s  %s" % ('script', 'best ms', 'median ms', 'notes'))
+    for script in scripts:
+        secs = []
+        for i in range(max(1, g_args.runs)):
+            wall, status, err = run(script)
+            secs.append(wall)
+        secs.sort()
+        note = '' if status == 0 else 'exit %d: %s' % \
+            (status, (err.strip().splitlines() or [''])[-1][:60])
+        print("%-18s %10.1f %10.1f  %s" % (script, secs[0] * 1e3,
+                                           secs[len(secs) // 2] * 1e3, note))
+        if g_args.imports > 0:
+            wall, status, err = run(script, True)
+            for us, name in top_imports(err, g_args.imports):
+                print("%-18s %10.1f %10s  %s" % ('', us / 1e3, '', name))
+    sys.exit(0)
+
+# Standard boilerplate code to call main()
+if __name__ == '__main__':
+    main()
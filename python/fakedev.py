@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+#  DETAILS: Stand-in switch for exercising SSHConnect without real devices.
+#  CREATED: 18/Oct/2026 19:40:00 IST
+# MODIFIED: 18/Oct/2026 19:40:00 IST
+#
+#   AUTHOR: Ravikiran K.S., ravikirandotks@gmail.com
+#  LICENCE: Copyright (c) 2013, Ravikiran K.S.
+
+# Always leave the code you're editing a little better than you found it
+
+# Run under a pty (pexpect spawns it in place of 'ssh -l user host'). Walks
+# through same dialogue SSHConnect.expect() handles:
+#   host key yes/no question  (-k)
+#   Password: or admin: login (-p PASS, -a)
+#   shell prompt admin@fake:~$, cli enters vsh prompt admin@fake>
+# Commands understood at prompt:
+#   cli | vsh         enter vsh mode, exit in vsh mode gets back to shell
+#   echo <text>       print text
+#   huge <nlines>     print nlines of ~80 bytes each
+#   slow <secs>       sleep secs, then print done
+#   hang              never return to prompt
+#   fail <text>       print text on stderr, exit status 1 (sshd mode)
+#   exit              logout
+#   anything else     print "ok: <cmd>"
+#
+# With -s, runs an in-process SSH server (fakesshd.FakeSSHD, needs paramiko)
+# instead, which answers exec requests with same cmds. With -r, exec
+# requests run under /bin/sh & sftp serves local files, a stand-in for linux
+# based switch when testing copies (SCPConnect).
+#
+# $ fakedev.py -k -p secret -d 0.01
+# $ fakedev.py -s 2222 -p secret
+# $ fakedev.py -s 2222 -p secret -r
+
+# Import all required modules
+# paramiko is only needed by -s, it is not imported in pty mode. bench
+# scripts start one of these per session and would pay for it every time.
+import time, sys
+import argparse
+
+def parse_args():
+    global g_args
+
+    parser = argparse.ArgumentParser(usage=__doc__)
+    parser.add_argument("-n", "--name", default = "fake",
+                        help="host name shown in prompts")
+    parser.add_argument("-k", "--hostkey", action = "store_true",
+                        help="ask yes/no host key question before login")
+    parser.add_argument("-p", "--passwd", default = None,
+                        help="ask for this password before prompt")
+    parser.add_argument("-a", "--admin", action = "store_true",
+                        help="ask password with admin: instead of Password:")
+    parser.add_argument("-d", "--delay", type = float, default = 0,
+                        help="secs to wait before every prompt (slow device)")
+    parser.add_argument("-l", "--login-delay", type = float, default = 0,
+                        help="secs to wait before login dialogue (handshake)")
+    parser.add_argument("-H", "--hang-after", type = int, default = -1,
+                        help="stop answering after these many cmds")
+    parser.add_argument("-s", "--sshd", type = int, default = None,
+                        help="serve exec requests over ssh on this port")
+    parser.add_argument("-r", "--real", action = "store_true",
+                        help="sshd runs exec under /bin/sh, serves sftp")
+    g_args = parser.parse_args()
+
+def out(text):
+    sys.stdout.write(text)
+    sys.stdout.flush()
+
+def read_line():
+    line = sys.stdin.readline()
+    if line == '':                      # pty closed
+        sys.exit(0)
+    return line.rstrip('\r\n')
+
+def login():
+    time.sleep(g_args.login_delay)
+    if g_args.hostkey is True:
+        out("The authenticity of host '%s (127.0.0.1)' can't be established.\r\n"
+            "ECDSA key fingerprint is SHA256:fakefakefakefakefakefake.\r\n"
+            "Are you sure you want to continue connecting (yes/no)? " %
+            (g_args.name))
+        if read_line().strip().lower() != 'yes':
+            out("Host key verification failed.\r\n")
+            sys.exit(255)
+
+    if g_args.passwd is None:
+        return
+    for i in range(3):
+        out("admin: " if g_args.admin is True else
+            "admin@%s's password: " % (g_args.name))
+        if read_line() == g_args.passwd:
+            return
+        out("Permission denied, please try again.\r\n")
+    sys.exit(255)
+
+def huge(nlines, write = out, eol = "\r\n"):
+    # write in big blocks, device side should not be the bottleneck
+    blk = []
+    for i in range(nlines):
+        blk.append("%08d %s%s" % (i, 'x' * 68, eol))
+        if len(blk) == 1024:
+            write(''.join(blk))
+            blk = []
+    write(''.join(blk))
+
+def exec_cmd(cmd, write, ewrite, eol = "\n"):
+    # cmds common to pty & sshd modes, returns exit status
+    words = cmd.split(None, 1)
+    verb = words[0] if words else ''
+    arg = words[1] if len(words) > 1 else ''
+    if verb == '':
+        return 0
+    elif verb == 'echo':
+        write(arg + eol)
+    elif verb == 'huge':
+        huge(int(arg or 1000), write, eol)
+    elif verb == 'slow':
+        time.sleep(float(arg or 1))
+        write("done" + eol)
+    elif verb == 'hang':
+        while True:
+            time.sleep(3600)
+    elif verb == 'fail':
+        ewrite(arg + eol)
+        return 1
+    else:
+        write("ok: %s%s" % (cmd, eol))
+    return 0
+
+def run_cmd(cmd):
+    global g_vsh
+
+    verb = cmd.split(None, 1)[0] if cmd else ''
+    if verb in ('cli', 'vsh'):
+        g_vsh = True
+    elif verb == 'exit' and g_vsh is True:
+        g_vsh = False
+    elif verb in ('exit', 'logout', 'quit'):
+        out("Connection to %s closed.\r\n" % (g_args.name))
+        sys.exit(0)
+    else:
+        exec_cmd(cmd, out, out, "\r\n")
+
+def main():
+    global g_args
+    global g_vsh
+
+    parse_args()
+    if g_args.sshd is not None:
+        from fakesshd import FakeSSHD
+        port = FakeSSHD(passwd = g_args.passwd, port = g_args.sshd,
+                        real = g_args.real).start()
+        out("fake sshd listening on port %d\n" % (port))
+        while True:
+            time.sleep(3600)
+    login()
+    g_vsh = False
+    ncmds = 0
+    while True:
+        time.sleep(g_args.delay)
+        out(("admin@%s> " if g_vsh is True else "admin@%s:~$ ") % (g_args.name))
+        try:
+            cmd = read_line()
+            if ncmds == g_args.hang_after:
+                while True:
+                    time.sleep(3600)
+            ncmds += 1
+            run_cmd(cmd.strip())
+        except KeyboardInterrupt:       # Ctrl-C, back to prompt like a shell
+            out("^C\r\n")
+
+# Standard boilerplate code to call main()
+if __name__ == '__main__':
+    main()
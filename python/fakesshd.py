@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+#  DETAILS: In-process SSH server standing in for switches (paramiko).
+#  CREATED: 18/Oct/2026 20:40:00 IST
+# MODIFIED: 18/Oct/2026 20:40:00 IST
+#
+#   AUTHOR: Ravikiran K.S., ravikirandotks@gmail.com
+#  LICENCE: Copyright (c) 2013, Ravikiran K.S.
+
+# Always leave the code you're editing a little better than you found it
+
+# Exec requests are answered with cmds of fakedev.py (echo, huge, slow, hang,
+# fail ...), or with real = True run under /bin/sh next to an sftp subsystem
+# on local files. Used by ParamikoConnect/SCPConnect tests & benchmarks, and
+# by 'fakedev.py -s PORT'.
+
+# Import all required modules
+import os, socket, struct, threading, subprocess
+try:
+    import paramiko
+except ImportError:
+    paramiko = None
+from fakedev import exec_cmd
+
+if paramiko is not None:
+    class FakeSSHServer(paramiko.ServerInterface):
+        # auth & channel policy of one client connection
+        def __init__(self, user, passwd, real = False):
+            self.user = user
+            self.passwd = passwd
+            self.real = real
+
+        def get_allowed_auths(self, username):
+            return 'password'
+
+        def check_auth_password(self, username, password):
+            if username == self.user and password == self.passwd:
+                return paramiko.AUTH_SUCCESSFUL
+            return paramiko.AUTH_FAILED
+
+        def check_channel_request(self, kind, chanid):
+            if kind == 'session':
+                return paramiko.OPEN_SUCCEEDED
+            return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+        def check_channel_exec_request(self, channel, command):
+            cmd = command.decode(errors = 'replace')
+            channel.get_transport().pending[channel.remote_chanid] = (channel,
+                                                                      cmd,
+                                                                      self.real)
+            return True
+
+    class FakeTransport(paramiko.Transport):
+        # like real sshd, run exec cmd only after its request is acked. Else a
+        # quick cmd can close channel before client hears request went through.
+        def __init__(self, sock):
+            super(FakeTransport, self).__init__(sock)
+            self.pending = {}
+
+        def _send_user_message(self, data):
+            super(FakeTransport, self)._send_user_message(data)
+            raw = data.asbytes()
+            if raw[:1] != paramiko.common.cMSG_CHANNEL_SUCCESS:
+                return
+            job = self.pending.pop(struct.unpack('>I', raw[1:5])[0], None)
+            if job is not None:
+                threading.Thread(target = run_exec, args = job,
+                                 daemon = True).start()
+
+    def run_exec(chan, cmd, real):
+        try:
+            if real is True:
+                proc = subprocess.run(cmd, shell = True, capture_output = True)
+                chan.sendall(proc.stdout)
+                chan.sendall_stderr(proc.stderr)
+                status = proc.returncode
+            else:
+                status = exec_cmd(cmd.strip(),
+                                  lambda t: chan.sendall(t.encode()),
+                                  lambda t: chan.sendall_stderr(t.encode()))
+            chan.send_exit_status(status)
+        except (OSError, EOFError):
+            pass
+        finally:
+            chan.close()
+
+    class LocalSFTP(paramiko.SFTPServerInterface):
+        # just enough of sftp on local files for copies, paths used as given
+        def open(self, path, flags, attr):
+            try:
+                fd = os.open(path, flags, attr.st_mode or 0o644)
+            except OSError as e:
+                return paramiko.SFTPServer.convert_errno(e.errno)
+            if flags & os.O_WRONLY:
+                mode = 'ab' if flags & os.O_APPEND else 'wb'
+            elif flags & os.O_RDWR:
+                mode = 'a+b' if flags & os.O_APPEND else 'r+b'
+            else:
+                mode = 'rb'
+            handle = paramiko.SFTPHandle(flags)
+            handle.readfile = handle.writefile = os.fdopen(fd, mode)
+            return handle
+
+        def stat(self, path):
+            try:
+                return paramiko.SFTPAttributes.from_stat(os.stat(path))
+            except OSError as e:
+                return paramiko.SFTPServer.convert_errno(e.errno)
+
+        lstat = stat
+
+        def chattr(self, path, attr):
+            # like sftp-server, SFTPServer.set_file_attr() zaps data on resize
+            try:
+                if attr._flags & attr.FLAG_SIZE:
+                    os.truncate(path, attr.st_size)
+                if attr._flags & attr.FLAG_PERMISSIONS:
+                    os.chmod(path, attr.st_mode)
+            except OSError as e:
+                return paramiko.SFTPServer.convert_errno(e.errno)
+            return paramiko.SFTP_OK
+
+        def remove(self, path):
+            try:
+                os.remove(path)
+            except OSError as e:
+                return paramiko.SFTPServer.convert_errno(e.errno)
+            return paramiko.SFTP_OK
+
+        def rename(self, oldpath, newpath):
+            try:
+                os.replace(oldpath, newpath)
+            except OSError as e:
+                return paramiko.SFTPServer.convert_errno(e.errno)
+            return paramiko.SFTP_OK
+
+        posix_rename = rename
+
+class FakeSSHD():
+    """
+    In-process SSH server for tests, accepts password auth & exec requests.
+    With real = True, exec runs under /bin/sh & sftp serves local files.
+        sshd = FakeSSHD(passwd = 'secret')
+        port = sshd.start()         # 0 picks a free port
+        ...
+        sshd.stop()
+    """
+    hostkey = None              # generated once, shared by all servers
+
+    def __init__(self, user = 'admin', passwd = None, port = 0,
+                 addr = '127.0.0.1', real = False):
+        if paramiko is None:
+            raise ImportError("paramiko is needed for sshd mode")
+        self.user = user
+        self.passwd = passwd
+        self.addr = addr
+        self.port = port
+        self.real = real
+        self.sock = None
+        self.transports = []
+
+    def start(self):
+        if FakeSSHD.hostkey is None:
+            FakeSSHD.hostkey = paramiko.RSAKey.generate(2048)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((self.addr, self.port))
+        self.sock.listen(128)
+        self.port = self.sock.getsockname()[1]
+        threading.Thread(target = self.serve, name = 'fakesshd',
+                         daemon = True).start()
+        return self.port
+
+    def serve(self):
+        while True:
+            try:
+                conn, peer = self.sock.accept()
+            except OSError:             # listening socket closed by stop()
+                return
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            trans = FakeTransport(conn)
+            trans.add_server_key(FakeSSHD.hostkey)
+            if self.real is True:
+                trans.set_subsystem_handler('sftp', paramiko.SFTPServer,
+                                            LocalSFTP)
+            self.transports.append(trans)
+            try:
+                trans.start_server(server = FakeSSHServer(self.user,
+                                                          self.passwd,
+                                                          self.real))
+            except (paramiko.SSHException, EOFError, OSError):
+                trans.close()
+
+    def stop(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+        for trans in self.transports:
+            trans.close()
+        self.transports = []
@@ -15,13 +15,12 @@
 # sys.path.insert(0, "/path/to/scripts/dir")   // add module to path at runtime
 
 # Import all required modules
-import struct, fcntl, glob, time, os, sys, re, signal
-import argparse, pdb, logging, globs, utils
+# netmiko takes long to import, it is imported in connect() that needs it
+import os, sys
+import argparse, logging, globs, utils
 print (sys.path)          # path from where modules are picked-up
-import logging.handlers as hdlrs
-import logging.config as config
-from netmiko import ConnectHandler
 from utils import Logger
+from utils import SCPConnect
 
 Linux_test = {
     'device_type': 'versa',
@@ -96,6 +95,7 @@ def connect():
         'verbose': True             # default False
     }
 
+    from netmiko import ConnectHandler
     #pdb.set_trace()
     globs.g_conn_hdl = ConnectHandler(**Linux_test)
     globs.g_conn_hdl.cli_out = globs.g_conn_hdl.send_command('uptime')
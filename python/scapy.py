@@ -14,48 +14,92 @@
 # $ python3 -m site         // place where packages are installed
 # print (sys.path)          // path from where modules are picked-up
 # sys.path.insert(0, "/path/to/scripts/dir")   // add module to path at runtime
+# Template mode (-T icmp|arp) builds frame once with scapy and then only
+# patches changing fields in raw bytes, sent on an AF_PACKET socket (root).
+# Test on a veth pair inside a namespace, without touching real network:
+# $ ip netns add pkt; ip link add pk0 type veth peer name pk1 netns pkt
+# $ ip link set pk0 up; ip netns exec pkt ip link set pk1 up
+# $ scapy.py -T icmp -i pk0 -s 10.9.0.1 -c 254 -n 1000000 -r 200000
+# Sweep mode (-S cidr) pings or ARPs every address with a bounded window of
+# probes in flight, prints hosts as replies come in:
+# $ scapy.py -T arp -i pk0 -S 10.9.0.0/16 -w 4096
+# Sweep & send_arp() answers are kept in a neighbor cache on disk (under
+# $SCRPT_CACHE, else ~/.cache), only stale or missing IPs are probed again.
+# Capture (-C file) reads frames off a TPACKET_V3 mmap ring, written as they
+# come to pcap (--ng: pcapng). With a sweep, --ring-mb reads its replies off
+# such a ring & -C saves them. -P file summarizes a pcap, mmap'ed.
+# $ scapy.py -C out.pcap -i pk0 -n 100000
+# $ scapy.py -T arp -i pk0 -S 10.9.0.0/16 --ring-mb 64 -C replies.pcap
 # Import all required modules
-import struct, fcntl, glob, time, os, sys, re, signal
+import os, sys, time, struct, socket, select, ipaddress, threading, queue
+import ctypes, json, mmap
+from collections import deque
 ppath = os.getenv('UTL_SCRPTS', default = os.getenv('HOME') + "/scripts/utils")
 #print(ppath)
 sys.path.insert(0, ppath + "/python")
-import argparse, pexpect, pdb, logging, globs, utils
+import argparse, logging, globs, utils
 from utils import Logger
-from scapy.all import*
+
+def scapy_all():
+    # scapy.all takes secs to import, so it is done only when packets are
+    # sent. This file is scapy.py too, keep its dir off sys.path meanwhile.
+    here = os.path.dirname(os.path.abspath(__file__))
+    saved = sys.path[:]
+    sys.path[:] = [p for p in sys.path if os.path.abspath(p or '.') != here]
+    try:
+        import scapy.all
+    finally:
+        sys.path[:] = saved
+    return scapy.all
 
 def send_arp1():
+    sc = scapy_all()
     #ether=ETHER()
-    arp=ARP()
+    arp=sc.ARP()
     #ether.dst='ff:ff:ff:ff:ff:ff'
     #dst=raw_input('n enter the destination ip address=')
     dst='10.40.122.22'
     arp.op=1
     arp.pdst=dst
     #sendp(ether/arp)
-    sendp(arp)
+    sc.sendp(arp)
 
 def send_arp():
+    neigh = NeighborCache()
+    ent = neigh.get('10.40.122.22', 'arp')
+    if ent is not None:
+        print("10.40.122.22 is-at %s (cached)" % (ent['mac']))
+        return
+    sc = scapy_all()
     # psrc='10.161.0.10', pdst='10.40.122.22',
-    results, unanswered = sr(ARP(op=ARP.who_has,
-                                 psrc='10.40.122.51',
-                                 pdst='10.40.122.22',
-                                 hwsrc='52:54:00:36:3c:9c',
-                                 hwdst='01:02:03:04:05:06'))
-
-                                 #hwdst='a0:04:60:12:8b:c3'))
-                                 #hwdst='ff:ff:ff:ff:ff:ff'))
+    results, unanswered = sc.sr(sc.ARP(op=sc.ARP.who_has,
+                                       psrc='10.40.122.51',
+                                       pdst='10.40.122.22',
+                                       hwsrc='52:54:00:36:3c:9c',
+                                       hwdst='01:02:03:04:05:06'))
+
+                                       #hwdst='a0:04:60:12:8b:c3'))
+                                       #hwdst='ff:ff:ff:ff:ff:ff'))
+    for snd, rcv in results:
+        neigh.update(rcv.psrc, True, mac = rcv.hwsrc)
+    for snd in unanswered:
+        neigh.update(snd.pdst, False)
+    neigh.save()
     print(results)
 
 def send_icmp_hello():
-    results, unanswered = sr(IP(dst="10.40.122.22-23")/ICMP()/"Hello World")
+    sc = scapy_all()
+    results, unanswered = sc.sr(sc.IP(dst="10.40.122.22-23")/sc.ICMP()/
+                                "Hello World")
 
     print(results)
 
 def send_icmp():
     #results, unanswered = sr(Ether(dst='ff:ff:ff:ff:ff:ff')/IP(dst='10.40.122.22')/ICMP()) # malformed packet
-    eth = Ether(src="52:54:00:36:3c:9c", dst="01:18:02:0a:0b:0c")
-    ip = IP(dst="10.40.122.22")                # optional: src="10.40.122.51"
-    pkt = eth/ip/ICMP()
+    sc = scapy_all()
+    eth = sc.Ether(src="52:54:00:36:3c:9c", dst="01:18:02:0a:0b:0c")
+    ip = sc.IP(dst="10.40.122.22")                # optional: src="10.40.122.51"
+    pkt = eth/ip/sc.ICMP()
     #results = sr1(pkt)          # does not work, malformed pkts. same for sr()
     #results = sendp(pkt)        # works (send only, no wait for rx), but storm of replies
 
@@ -65,10 +109,739 @@ def send_icmp():
     # work, it can't be used as it creates ICMP request/reply storm in network.
     # Because dest has no way of figuring out if ICMP req is a dup and eth-bcast
     # dmac leads to replication of requests within bcast domain
-    results, unanswered = srp(pkt)  # works both send+recv, but storm of replies
+    results, unanswered = sc.srp(pkt)  # works both send+recv, but storm of replies
 
     print(results)
 
+ETH_LEN = 14                    # no vlan tag in templates
+
+def csum_add(total, data):
+    # ones complement sum of 16 bit words, data is of even length
+    total += sum(struct.unpack('!%dH' % (len(data) // 2), data))
+    return total
+
+def csum_fold(total):
+    while total >> 16:
+        total = (total & 0xffff) + (total >> 16)
+    return ~total & 0xffff
+
+class PktTemplate():
+    """
+    Frame built once by scapy. For each packet only dst IP, IP id, ICMP
+    id/seq & both checksums (ARP: target IP) are patched at fixed offsets
+    in a bytearray, checksums from sums of fixed bytes done up front, so a
+    packet costs a few struct.pack_into() calls instead of a scapy build.
+        tmpl = PktTemplate.icmp('pk0', '10.9.0.1')
+        sent, secs = tmpl.send(count = 100000, pps = 50000, span = 254)
+    """
+    def __init__(self, frame, kind):
+        self.frame = bytearray(frame)
+        self.kind = kind
+        if kind == 'arp':
+            self.dst = ETH_LEN + 24         # target protocol address
+            return
+        ip = ETH_LEN
+        self.l4 = ip + (self.frame[ip] & 0x0f) * 4
+        self.dst = ip + 16
+        self.ipid = ip + 4
+        self.ipsum = ip + 10
+        self.icmpsum = self.l4 + 2
+        # sums of bytes that never change, fields patched per packet as 0
+        for off in (self.ipid, self.ipsum, self.dst, self.dst + 2,
+                    self.icmpsum, self.l4 + 4, self.l4 + 6):
+            struct.pack_into('!H', self.frame, off, 0)
+        self.ip_base = csum_add(0, self.frame[ip:self.l4])
+        payload = self.frame[self.l4:]
+        if len(payload) % 2:
+            payload += b'\0'
+        self.icmp_base = csum_add(0, payload)
+
+    @staticmethod
+    def build(kind, iface, dst, smac = None, dmac = None, src = None,
+              size = 64):
+        # size is of whole frame without FCS, as seen on wire
+        sc = scapy_all()
+        smac = smac or sc.get_if_hwaddr(iface)
+        src = src or sc.get_if_addr(iface)
+        if kind == 'arp':
+            pkt = sc.Ether(src = smac, dst = 'ff:ff:ff:ff:ff:ff') / \
+                  sc.ARP(op = 1, hwsrc = smac, psrc = src, pdst = dst)
+        else:
+            dmac = dmac or sc.getmacbyip(dst) or 'ff:ff:ff:ff:ff:ff'
+            pkt = sc.Ether(src = smac, dst = dmac) / \
+                  sc.IP(src = src, dst = dst) / sc.ICMP(id = 0, seq = 0)
+        frame = bytes(pkt)
+        frame += b'\0' * max(0, size - len(frame))
+        return PktTemplate(frame, kind)
+
+    @staticmethod
+    def icmp(iface, dst, **kwargs):
+        return PktTemplate.build('icmp', iface, dst, **kwargs)
+
+    @staticmethod
+    def arp(iface, dst, **kwargs):
+        return PktTemplate.build('arp', iface, dst, **kwargs)
+
+    def patch(self, dst, seq, ident = 0):
+        # dst is IP as int, seq is also used as IP id
+        hi = dst >> 16
+        lo = dst & 0xffff
+        seq &= 0xffff
+        frame = self.frame
+        struct.pack_into('!HH', frame, self.dst, hi, lo)
+        if self.kind == 'arp':
+            return frame
+        struct.pack_into('!H', frame, self.ipid, seq)
+        struct.pack_into('!H', frame, self.ipsum,
+                         csum_fold(self.ip_base + hi + lo + seq))
+        struct.pack_into('!HH', frame, self.l4 + 4, ident, seq)
+        struct.pack_into('!H', frame, self.icmpsum,
+                         csum_fold(self.icmp_base + ident + seq))
+        return frame
+
+    def send(self, iface, dst, count, pps = 0, batch = 64, span = 1,
+             ident = 0):
+        """
+        Send count packets to span consecutive IPs from dst, cycling. Pacing
+        is checked once per batch of back to back sends, pps 0 is flat out.
+        Returns (packets sent, secs taken).
+        """
+        base = int(ipaddress.IPv4Address(dst))
+        dsts = [base + i for i in range(max(1, span))]
+        sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW)
+        sock.bind((iface, 0))
+        send = sock.send
+        gap = batch / pps if pps > 0 else 0
+        sent = 0
+        start = time.perf_counter()
+        due = start
+        try:
+            while sent < count:
+                for seq in range(sent, min(sent + batch, count)):
+                    send(self.patch(dsts[seq % len(dsts)], seq, ident))
+                sent = min(sent + batch, count)
+                if gap:
+                    due += gap
+                    lag = due - time.perf_counter()
+                    if lag > 0:
+                        time.sleep(lag)
+                    elif lag < -1:
+                        due = time.perf_counter()   # do not burst to catch up
+        finally:
+            sock.close()
+        return sent, time.perf_counter() - start
+
+SO_ATTACH_FILTER = 26
+ETH_P_ARP = 0x0806
+
+def bpf(*insns):
+    # classic BPF program (code, jt, jf, k) tuples -> sock_fprog to attach
+    prog = b''.join(struct.pack('HBBI', *insn) for insn in insns)
+    buf = ctypes.create_string_buffer(prog)
+    return buf, struct.pack('HL', len(insns), ctypes.addressof(buf))
+
+# raw ICMP socket gets IP packets: pass echo replies (type 0 after IP header)
+BPF_ICMP_REPLY = ((0xb1, 0, 0, 0),      # ldxb 4*([0]&0xf)
+                  (0x50, 0, 0, 0),      # ldb [x + 0]
+                  (0x15, 0, 1, 0),      # jeq #0 (echo reply)
+                  (0x06, 0, 0, 0xffff), # ret #65535
+                  (0x06, 0, 0, 0))      # ret #0
+# ARP packet socket gets ether frames: pass ARP replies (op 2)
+BPF_ARP_REPLY = ((0x28, 0, 0, 20),      # ldh [20]
+                 (0x15, 0, 1, 2),       # jeq #2 (reply)
+                 (0x06, 0, 0, 0xffff),  # ret #65535
+                 (0x06, 0, 0, 0))       # ret #0
+# capture ring gets all ether frames, same filters with ethertype check
+BPF_ETH_ICMP_REPLY = ((0x28, 0, 0, 12),     # ldh [12]
+                      (0x15, 0, 8, 0x0800), # jeq #ip
+                      (0x30, 0, 0, 23),     # ldb [23]
+                      (0x15, 0, 6, 1),      # jeq #icmp
+                      (0x28, 0, 0, 20),     # ldh [20]
+                      (0x45, 4, 0, 0x1fff), # jset #0x1fff (not 1st fragment)
+                      (0xb1, 0, 0, 14),     # ldxb 4*([14]&0xf)
+                      (0x50, 0, 0, 14),     # ldb [x + 14]
+                      (0x15, 0, 1, 0),      # jeq #0 (echo reply)
+                      (0x06, 0, 0, 0xffff), # ret #65535
+                      (0x06, 0, 0, 0))      # ret #0
+BPF_ETH_ARP_REPLY = ((0x28, 0, 0, 12),      # ldh [12]
+                     (0x15, 0, 3, 0x0806),  # jeq #arp
+                     (0x28, 0, 0, 20),      # ldh [20]
+                     (0x15, 0, 1, 2),       # jeq #2 (reply)
+                     (0x06, 0, 0, 0xffff),  # ret #65535
+                     (0x06, 0, 0, 0))       # ret #0
+BPF_NONE = ((0x06, 0, 0, 0),)               # ret #0
+
+SOL_PACKET = 263
+PACKET_RX_RING = 5
+PACKET_STATISTICS = 6
+PACKET_VERSION = 10
+TPACKET_V3 = 2
+TP_STATUS_USER = 1
+ETH_P_ALL = 0x0003
+
+class RingCapture():
+    """
+    Capture on a TPACKET_V3 ring mmap'ed from kernel: kernel fills blocks of
+    frames (after BPF filter), frames are handed out as memoryviews of the
+    ring, no copy & no per frame syscall. Memory is the ring, whatever the
+    rate, if reader falls behind kernel drops & counts (stats()). A view is
+    valid only till next block is asked for, copy it (bytes(view)) to keep.
+        ring = RingCapture('pk0', BPF_ETH_ARP_REPLY, size_mb = 64)
+        for ts, wirelen, frame in ring.frames():
+            ...
+    """
+    def __init__(self, iface, filt = None, size_mb = 64, block_size = 1 << 20,
+                 frame_size = 2048, block_tmo = 10):
+        self.block_size = block_size
+        self.block_nr = max(1, (size_mb << 20) // block_size)
+        self.sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW,
+                                  socket.htons(ETH_P_ALL))
+        if filt is not None:
+            buf, fprog = bpf(*filt)
+            self.sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
+        self.sock.setsockopt(SOL_PACKET, PACKET_VERSION, TPACKET_V3)
+        # tpacket_req3: block size & count, frame size & count, block
+        # retire timeout (ms), priv size, feature word
+        req = struct.pack('=7I', block_size, self.block_nr, frame_size,
+                          block_size * self.block_nr // frame_size,
+                          block_tmo, 0, 0)
+        self.sock.setsockopt(SOL_PACKET, PACKET_RX_RING, req)
+        self.sock.bind((iface, ETH_P_ALL))
+        self.ring = mmap.mmap(self.sock.fileno(),
+                              block_size * self.block_nr)
+        self.view = memoryview(self.ring)
+        self.block = 0
+
+    def frames(self, timeout = 0.1, stop = None):
+        """
+        Yields (timestamp ns, wire length, frame memoryview) until stop()
+        is True, waiting up to timeout secs at a time for a block.
+        """
+        poll = select.poll()
+        poll.register(self.sock, select.POLLIN | select.POLLERR)
+        ring = self.ring
+        view = self.view
+        while stop is None or not stop():
+            blk = self.block * self.block_size
+            # tpacket_block_desc: version, priv offset, then tpacket_hdr_v1
+            status, npkts, pos = struct.unpack_from('=III', ring, blk + 8)
+            if not status & TP_STATUS_USER:
+                poll.poll(timeout * 1000)
+                continue
+            pos += blk
+            for i in range(npkts):
+                # tpacket3_hdr: next offset, sec, nsec, snaplen, len,
+                # status, mac offset
+                nxt, sec, nsec, snap, wlen, st, mac = \
+                    struct.unpack_from('=6IH', ring, pos)
+                yield sec * 1000000000 + nsec, wlen, \
+                    view[pos + mac:pos + mac + snap]
+                pos += nxt
+            struct.pack_into('=I', ring, blk + 8, 0)  # back to kernel
+            self.block = (self.block + 1) % self.block_nr
+
+    def stats(self):
+        # (packets, drops) since last call, counters reset on read
+        return struct.unpack('=2I', self.sock.getsockopt(SOL_PACKET,
+                                                         PACKET_STATISTICS,
+                                                         12)[:8])
+
+    def close(self):
+        try:
+            self.view.release()
+            self.ring.close()
+        except BufferError:
+            pass                        # a frame view still held by caller
+        self.sock.close()
+
+class PcapWriter():
+    """
+    Streaming pcap writer (pcapng with ng = True), nanosecond timestamps.
+    Records go through a 1MB file buffer, nothing else is held in memory.
+    """
+    def __init__(self, path, linktype = 1, snaplen = 262144, ng = False):
+        self.ng = ng
+        self.f = open(path, 'wb', buffering = 1 << 20)
+        if ng is False:
+            self.f.write(struct.pack('=IHHiIII', 0xa1b23c4d, 2, 4, 0, 0,
+                                     snaplen, linktype))
+            return
+        # section header, then interface with if_tsresol option = 9 (ns)
+        self.f.write(struct.pack('=IIIHHqI', 0x0a0d0d0a, 28, 0x1a2b3c4d, 1,
+                                 0, -1, 28))
+        self.f.write(struct.pack('=IIHHIHHB3xHHI', 1, 32, linktype, 0,
+                                 snaplen, 9, 1, 9, 0, 0, 32))
+
+    def write(self, ts, wirelen, data):
+        # ts in ns, data is bytes like (memoryview of a ring frame is fine)
+        caplen = len(data)
+        if self.ng is False:
+            self.f.write(struct.pack('=IIII', ts // 1000000000,
+                                     ts % 1000000000, caplen, wirelen))
+            self.f.write(data)
+            return
+        pad = -caplen % 4
+        blen = 32 + caplen + pad
+        self.f.write(struct.pack('=IIIIIII', 6, blen, 0, ts >> 32,
+                                 ts & 0xffffffff, caplen, wirelen))
+        self.f.write(data)
+        self.f.write(b'\0' * pad + struct.pack('=I', blen))
+
+    def close(self):
+        self.f.close()
+
+class PcapReader():
+    """
+    pcap file mmap'ed read only, records handed out as memoryviews of the
+    map, so even big files are walked without reading them into memory.
+        with PcapReader('out.pcap') as pcap:
+            for ts, wirelen, frame in pcap:
+                ...
+    """
+    def __init__(self, path):
+        self.f = open(path, 'rb')
+        self.map = mmap.mmap(self.f.fileno(), 0, access = mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+        magic = self.map[:4]
+        for order in ('<', '>'):
+            val = struct.unpack(order + 'I', magic)[0]
+            if val in (0xa1b2c3d4, 0xa1b23c4d):
+                break
+        else:
+            raise ValueError("%s is not a pcap file" % (path))
+        self.order = order
+        self.scale = 1000 if val == 0xa1b2c3d4 else 1       # usec or nsec
+        self.linktype = struct.unpack_from(order + 'I', self.map, 20)[0]
+
+    def __iter__(self):
+        hdr = struct.Struct(self.order + 'IIII')
+        buf = self.map
+        end = len(buf)
+        pos = 24
+        while pos + 16 <= end:
+            sec, frac, caplen, wirelen = hdr.unpack_from(buf, pos)
+            pos += 16
+            yield sec * 1000000000 + frac * self.scale, wirelen, \
+                self.view[pos:pos + caplen]
+            pos += caplen
+
+    def close(self):
+        try:
+            self.view.release()
+            self.map.close()
+        except BufferError:
+            pass
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+class Sweeper():
+    """
+    Ping (kind 'icmp') or ARP (kind 'arp') sweep of many addresses, keeping
+    at most window probes in flight. A receiver thread behind a BPF filter
+    matches each reply in O(1), by (ICMP id, seq) or by ARP sender IP, in a
+    dict of outstanding probes. Probes expire in send order, so a deque of
+    deadlines finds them without scanning. Results are yielded as they come:
+        for ip, rtt, mac in Sweeper('icmp', 'pk0').sweep(hosts):
+            print(ip, 'down' if rtt is None else rtt)
+    Needs root, for raw sockets.
+    """
+    def __init__(self, kind, iface = None, window = 4096, timeout = 1.0,
+                 retries = 1, pps = 0, ring_mb = 0, pcap = None):
+        self.kind = kind
+        self.ring_mb = ring_mb          # > 0 reads replies off RingCapture
+        self.pcap = pcap                # PcapWriter for replies off ring
+        self.ring = None
+        self.iface = iface
+        self.window = max(1, window)
+        self.timeout = timeout
+        self.retries = retries
+        self.pps = pps
+        self.ident = os.getpid() & 0xffff
+        self.lock = threading.Lock()
+        self.pending = {}               # key -> [ip, sent time, tries]
+        self.replies = queue.SimpleQueue()
+        self.running = False
+
+    def open(self):
+        if self.kind == 'arp':
+            if self.iface is None:
+                globs.die("ARP sweep needs an interface")
+            self.tmpl = PktTemplate.arp(self.iface, '0.0.0.0')
+            self.sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW,
+                                      socket.htons(ETH_P_ARP))
+            self.sock.bind((self.iface, ETH_P_ARP))
+            buf, fprog = bpf(*BPF_ARP_REPLY)
+        else:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_RAW,
+                                      socket.IPPROTO_ICMP)
+            if self.iface is not None:
+                self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_BINDTODEVICE,
+                                     self.iface.encode())
+            # echo request, id/seq/checksum patched per probe
+            self.probe = bytearray(struct.pack('!BBHHH', 8, 0, 0, 0, 0) +
+                                   b'scrpt-sweep'.ljust(48, b'.'))
+            self.probe_base = csum_add(0, self.probe)
+            buf, fprog = bpf(*BPF_ICMP_REPLY)
+        if self.ring_mb > 0:
+            if self.iface is None:
+                globs.die("ring capture needs an interface")
+            self.ring = RingCapture(self.iface, BPF_ETH_ARP_REPLY if
+                                    self.kind == 'arp' else
+                                    BPF_ETH_ICMP_REPLY, self.ring_mb)
+            buf, fprog = bpf(*BPF_NONE)     # send only, ring gets replies
+        self.sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 22)
+
+    def key(self, idx, ip):
+        # ICMP: seq is low 16 bits of index, high bits go into id
+        if self.kind == 'arp':
+            return ip
+        return ((self.ident + (idx >> 16)) & 0xffff, idx & 0xffff)
+
+    def send(self, key, ip):
+        if self.kind == 'arp':
+            self.sock.send(self.tmpl.patch(ip, 0))
+            return
+        ident, seq = key
+        struct.pack_into('!HHH', self.probe, 2,
+                         csum_fold(self.probe_base + ident + seq), ident, seq)
+        try:
+            self.sock.sendto(self.probe, (str(ipaddress.IPv4Address(ip)), 0))
+        except OSError:
+            pass                # broadcast/unroutable, expires as down
+
+    def match(self, pkt):
+        # key, sender IP & MAC (ARP only) of a reply, None for anything else
+        if self.kind == 'arp':
+            if len(pkt) < ETH_LEN + 28:
+                return None
+            ip = struct.unpack_from('!I', pkt, ETH_LEN + 14)[0]
+            return ip, ip, pkt[ETH_LEN + 8:ETH_LEN + 14].hex(':')
+        l4 = (pkt[0] & 0x0f) * 4
+        if len(pkt) < l4 + 8:
+            return None
+        ident, seq = struct.unpack_from('!HH', pkt, l4 + 4)
+        return (ident, seq), struct.unpack_from('!I', pkt, 12)[0], None
+
+    def packets(self):
+        # replies as seen by match(): ether frames for ARP, IP for ICMP
+        if self.ring is not None:
+            skip = 0 if self.kind == 'arp' else ETH_LEN
+            for ts, wirelen, frame in self.ring.frames(
+                    stop = lambda: not self.running):
+                if self.pcap is not None:
+                    self.pcap.write(ts, wirelen, frame)
+                yield frame[skip:]
+            return
+        # socket stays blocking for sends, full tx queue just slows sender
+        recv = self.sock.recv
+        while self.running:
+            try:
+                if not select.select([self.sock], [], [], 0.1)[0]:
+                    continue
+                yield recv(2048)
+            except OSError:
+                return
+
+    def receive(self):
+        for pkt in self.packets():
+            now = time.perf_counter()
+            res = self.match(pkt)
+            if res is None:
+                continue
+            key, src, mac = res
+            with self.lock:
+                probe = self.pending.get(key)
+                if probe is None or probe[0] != src:
+                    continue            # late, duplicate or not ours
+                del self.pending[key]
+            self.replies.put((probe[0], now - probe[1], mac))
+
+    def expire(self, deadlines, retry, now):
+        # probes still pending past deadline go for retry or are reported
+        down = []
+        while deadlines and deadlines[0][0] <= now:
+            deadline, key, sent = deadlines.popleft()
+            with self.lock:
+                probe = self.pending.get(key)
+                if probe is None or probe[1] != sent:
+                    continue            # answered, or resent since
+                if probe[2] <= self.retries:
+                    retry.append((key, probe[0]))
+                    continue
+                del self.pending[key]
+            down.append(probe[0])
+        return down
+
+    def sweep(self, hosts):
+        """
+        Probe each IPv4 address in hosts (strings or ints), yields (ip, rtt
+        secs, mac) for hosts that replied and (ip, None, None) for those
+        that did not, in order of completion. mac is None for ICMP.
+        """
+        self.open()
+        self.running = True
+        rx = threading.Thread(target = self.receive, name = 'sweep-rx',
+                              daemon = True)
+        rx.start()
+        targets = iter(enumerate(int(ipaddress.IPv4Address(h)) for h in hosts))
+        deadlines = deque()
+        retry = deque()
+        gap = 64 / self.pps if self.pps > 0 else 0
+        due = time.perf_counter()
+        nsent = 0
+        done = False
+        try:
+            while not done or self.pending:
+                now = time.perf_counter()
+                # keep window full, resent probes first
+                while len(self.pending) < self.window or retry:
+                    if retry:
+                        key, ip = retry.popleft()
+                        with self.lock:
+                            # late reply may have answered it since expire()
+                            probe = self.pending.get(key)
+                            if probe is None:
+                                continue
+                            self.pending[key] = [ip, now, probe[2] + 1]
+                    else:
+                        nxt = next(targets, None) if not done else None
+                        if nxt is None:
+                            done = True
+                            break
+                        key = self.key(*nxt)
+                        ip = nxt[1]
+                        with self.lock:
+                            self.pending[key] = [ip, now, 1]
+                    deadlines.append((now + self.timeout, key, now))
+                    self.send(key, ip)
+                    nsent += 1
+                    if gap and nsent % 64 == 0:
+                        due += gap
+                        if due > time.perf_counter():
+                            time.sleep(due - time.perf_counter())
+                        now = time.perf_counter()
+                for ip in self.expire(deadlines, retry, now):
+                    yield str(ipaddress.IPv4Address(ip)), None, None
+                try:
+                    ip, rtt, mac = self.replies.get(timeout = 0.01)
+                    while True:
+                        yield str(ipaddress.IPv4Address(ip)), rtt, mac
+                        ip, rtt, mac = self.replies.get_nowait()
+                except queue.Empty:
+                    pass
+            while not self.replies.empty():
+                ip, rtt, mac = self.replies.get()
+                yield str(ipaddress.IPv4Address(ip)), rtt, mac
+        finally:
+            self.running = False
+            rx.join()
+            self.sock.close()
+            if self.ring is not None:
+                self.ring.close()
+
+class NeighborCache():
+    """
+    IP -> MAC & up/down table from ARP & ICMP probes, kept between runs in a
+    json file. Entries older than ttl (neg_ttl for hosts that did not
+    answer) are stale, and are dropped from file once older than keep
+    times the larger of the two. resolve() answers fresh ones from table
+    and probes only stale or missing ones, all in one sweep:
+        neigh = NeighborCache()
+        for ip, ent, cached in neigh.resolve(hosts, 'arp', 'pk0'):
+            print(ip, ent['mac'] if ent['up'] else 'down')
+    """
+    keep = 3                            # ttls a stale entry stays on file
+
+    def __init__(self, path = None, ttl = 1200, neg_ttl = 60):
+        cdir = os.getenv('SCRPT_CACHE',
+                         default = os.path.join(os.getenv('HOME'), '.cache'))
+        self.path = path or os.path.join(cdir, 'neighbors.json')
+        self.ttl = ttl
+        self.neg_ttl = neg_ttl
+        self.table = self.load()
+        self.dirty = {}                 # entries updated by this run
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        # merge with what other runs saved meanwhile, newer entry wins.
+        # Long stale entries go, so file does not grow with every IP seen.
+        if not self.dirty:
+            return
+        table = self.load()
+        for ip, ent in self.dirty.items():
+            if ip not in table or table[ip]['seen'] <= ent['seen']:
+                table[ip] = ent
+        horizon = time.time() - self.keep * max(self.ttl, self.neg_ttl)
+        table = {ip: ent for ip, ent in table.items() if ent['seen'] > horizon}
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok = True)
+        tmp = '%s.%d' % (self.path, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump(table, f)
+        os.rename(tmp, self.path)
+        self.table = table
+        self.dirty = {}
+
+    def get(self, ip, kind = None, now = None):
+        # fresh entry of ip good for a kind of probe, None if it must be sent
+        ent = self.table.get(ip)
+        if ent is None:
+            return None
+        age = (now or time.time()) - ent['seen']
+        if age > (self.ttl if ent['up'] else self.neg_ttl):
+            return None
+        if kind == 'arp' and ent['up'] and ent['mac'] is None:
+            return None                 # only ICMP seen it, no MAC yet
+        if kind is not None and not ent['up'] and ent['via'] != kind:
+            return None                 # no ARP reply does not mean no ping
+        return ent
+
+    def update(self, ip, up, mac = None, via = 'arp', now = None):
+        old = self.get(ip, now = now)
+        if up and mac is None and old is not None:
+            mac = old['mac']            # ICMP reply, keep MAC ARP learnt
+        ent = {'up': up, 'mac': mac, 'via': via, 'seen': now or time.time()}
+        self.table[ip] = ent
+        self.dirty[ip] = ent
+        return ent
+
+    def resolve(self, hosts, kind = 'arp', iface = None, window = 4096,
+                timeout = 1.0, pps = 0, ring_mb = 0, pcap = None,
+                fresh = False):
+        """
+        Yields (ip, entry, cached) for each IPv4 address in hosts, cached
+        ones first, then probed ones as answers come. Saved at end.
+        ring_mb & pcap are passed on to Sweeper. fresh probes all hosts,
+        table is still updated (ICMP replies keep MACs it has).
+        """
+        now = time.time()
+        stale = []
+        for host in hosts:
+            ip = str(ipaddress.IPv4Address(host))
+            ent = None if fresh else self.get(ip, kind, now)
+            if ent is None:
+                stale.append(ip)
+            else:
+                yield ip, ent, True
+        if not stale:
+            return
+        swp = Sweeper(kind, iface, window, timeout, pps = pps,
+                      ring_mb = ring_mb, pcap = pcap)
+        try:
+            for ip, rtt, mac in swp.sweep(stale):
+                yield ip, self.update(ip, rtt is not None, mac, kind), False
+        finally:
+            self.save()
+
+def sweep():
+    global g_args
+
+    net = ipaddress.IPv4Network(g_args.sweep, strict = False)
+    hosts = net.hosts() if net.num_addresses > 2 else iter(net)
+    neigh = NeighborCache(ttl = g_args.ttl)
+    pcap = None
+    if g_args.capture is not None:
+        g_args.ring_mb = g_args.ring_mb or 64
+        pcap = PcapWriter(g_args.capture, ng = g_args.ng)
+    start = time.perf_counter()
+    nup = 0
+    ndown = 0
+    ncached = 0
+    for ip, ent, cached in neigh.resolve(hosts, g_args.template or 'icmp',
+                                         g_args.iface, g_args.window,
+                                         g_args.timeout, g_args.rate,
+                                         g_args.ring_mb, pcap, g_args.fresh):
+        ncached += 1 if cached else 0
+        if ent['up'] is False:
+            ndown += 1
+            if g_args.verbose:
+                print("%-16s down%s" % (ip, ' (cached)' if cached else ''))
+        else:
+            nup += 1
+            print("%-16s up  %-17s %s" % (ip, ent['mac'] or '',
+                                          '(cached)' if cached else ''))
+        sys.stdout.flush()
+    secs = time.perf_counter() - start
+    print("%d of %d up, %d from cache, swept in %.1fs" %
+          (nup, nup + ndown, ncached, secs))
+    if pcap is not None:
+        pcap.close()
+
+def capture():
+    global g_args
+
+    if g_args.iface is None:
+        globs.die("capture needs -i iface")
+    filt = {'arp': BPF_ETH_ARP_REPLY, 'icmp': BPF_ETH_ICMP_REPLY,
+            None: None}[g_args.template]
+    ring = RingCapture(g_args.iface, filt, g_args.ring_mb or 64)
+    pcap = PcapWriter(g_args.capture, ng = g_args.ng)
+    npkts = 0
+    nbytes = 0
+    start = time.perf_counter()
+    try:
+        for ts, wirelen, frame in ring.frames():
+            pcap.write(ts, wirelen, frame)
+            npkts += 1
+            nbytes += wirelen
+            if npkts == g_args.count:
+                break
+    except KeyboardInterrupt:
+        pass
+    secs = time.perf_counter() - start
+    pkts, drops = ring.stats()
+    pcap.close()
+    ring.close()
+    print("%d pkts, %d bytes in %.1fs to %s, kernel dropped %d" %
+          (npkts, nbytes, secs, g_args.capture, drops))
+
+def read_pcap():
+    global g_args
+
+    npkts = 0
+    nbytes = 0
+    first = last = None
+    types = {}
+    with PcapReader(g_args.read) as pcap:
+        for ts, wirelen, frame in pcap:
+            npkts += 1
+            nbytes += wirelen
+            first = ts if first is None else first
+            last = ts
+            if pcap.linktype == 1 and len(frame) >= ETH_LEN:
+                etype = struct.unpack_from('!H', frame, 12)[0]
+                types[etype] = types.get(etype, 0) + 1
+    secs = (last - first) / 1e9 if npkts else 0
+    print("%d pkts, %d bytes over %.3fs" % (npkts, nbytes, secs))
+    for etype, count in sorted(types.items(), key = lambda t: -t[1]):
+        print("  ethertype 0x%04x: %d" % (etype, count))
+
+def send_template():
+    global g_args
+
+    if g_args.iface is None or g_args.switch is None:
+        globs.die("template mode needs -i iface & -s dst ip")
+    tmpl = PktTemplate.build(g_args.template, g_args.iface, g_args.switch,
+                             dmac = g_args.dmac, size = g_args.size)
+    sent, secs = tmpl.send(g_args.iface, g_args.switch, g_args.count,
+                           pps = g_args.rate, batch = g_args.batch,
+                           span = g_args.span, ident = os.getpid() & 0xffff)
+    print("%s: %d pkts in %.2fs, %.0f pps (target %s), %.1f Mbps" %
+          (g_args.template, sent, secs, sent / secs if secs else 0,
+           g_args.rate or 'max', sent * len(tmpl.frame) * 8 / secs / 1e6
+           if secs else 0))
+
 def parse_args():
     global g_args
 
@@ -91,6 +864,41 @@ def parse_args():
     parser.add_argument("-t", "--trace", action="store_true",
                         help="enable trace mode for script")
 
+    parser.add_argument("-T", "--template", choices = ["icmp", "arp"],
+                        default = None,
+                        help="send prebuilt frames, patched per packet")
+    parser.add_argument("-i", "--iface", default = None,
+                        help="interface to send template frames on")
+    parser.add_argument("-n", "--count", type = int, default = 100000,
+                        help="template frames to send")
+    parser.add_argument("-r", "--rate", type = int, default = 0,
+                        help="target pps for template frames, 0 for max")
+    parser.add_argument("-b", "--batch", type = int, default = 64,
+                        help="frames sent back to back between rate checks")
+    parser.add_argument("-c", "--span", type = int, default = 1,
+                        help="cycle dst over these many IPs from -s")
+    parser.add_argument("-z", "--size", type = int, default = 64,
+                        help="template frame size, padded with zeros")
+    parser.add_argument("--dmac", default = None,
+                        help="dst MAC of icmp template, else ARP resolved")
+    parser.add_argument("-S", "--sweep", default = None,
+                        help="ping (or with -T arp, ARP) all IPs of cidr")
+    parser.add_argument("-w", "--window", type = int, default = 4096,
+                        help="sweep probes in flight at most")
+    parser.add_argument("--timeout", type = float, default = 1.0,
+                        help="secs to wait for reply to a sweep probe")
+    parser.add_argument("--ttl", type = int, default = 1200,
+                        help="secs a cached neighbor is trusted for")
+    parser.add_argument("--fresh", action = "store_true",
+                        help="ignore neighbor cache, probe all")
+    parser.add_argument("-C", "--capture", default = None,
+                        help="capture on -i to pcap file (-T kind replies)")
+    parser.add_argument("--ng", action = "store_true",
+                        help="write capture as pcapng instead of pcap")
+    parser.add_argument("--ring-mb", type = int, default = 0,
+                        help="MB of mmap ring for capture / sweep replies")
+    parser.add_argument("-P", "--read", default = None,
+                        help="summarize pcap file, read via mmap")
     mandatory = parser.add_argument_group('mandatory arguments')
 
     mandatory.add_argument("-s", "--switch", default=None,
@@ -113,6 +921,18 @@ def main():
         print ("g_args: ", g_args)
         dump_python_details()
 
+    if g_args.read is not None:
+        read_pcap()
+        sys.exit(0)
+    if g_args.sweep is not None:
+        sweep()
+        sys.exit(0)
+    if g_args.capture is not None:
+        capture()
+        sys.exit(0)
+    if g_args.template is not None:
+        send_template()
+        sys.exit(0)
     print ("send arp")
     #send_arp()
     send_icmp_hello()
@@ -15,14 +15,15 @@
 # sys.path.insert(0, "/path/to/scripts/dir")   // add module to path at runtime
 
 # Import all required modules
-import struct, fcntl, glob, time, os, sys, re, signal
-import argparse, pexpect, pdb, logging, globs, utils
-import logging.handlers as hdlrs
-import logging.config as config
-from pexpect import pxssh
+# heavy modules (pexpect, paramiko, asyncio) are loaded by utils on first use
+import os, sys
+import argparse, logging, globs, utils
 from utils import Logger
 from utils import SSHConnect
 from utils import SCPConnect
+from utils import SSHFanout
+from utils import SCPDistribute
+from utils import ParamikoConnect
 
 def parse_args():
     global g_args
@@ -44,6 +45,26 @@ def parse_args():
                         help="file/dir path to be copied to switch (recursive)")
     parser.add_argument("-r", "--rpath", default = None,
                         help="remote path where to copy (use with -f/-d)")
+    parser.add_argument("-S", "--streams", type = int, default = 0,
+                        help="parallel chunked, resumable copy on N streams")
+    parser.add_argument("-R", "--relay", type = int, default = 0,
+                        help="copies each seeded switch forwards (with -H/-F)")
+    parser.add_argument("-H", "--hosts", default = None,
+                        help="comma separated switch names/ips for fan-out")
+    parser.add_argument("-F", "--hosts-file", default = None,
+                        help="file with one switch name/ip per line (fan-out)")
+    parser.add_argument("-c", "--cmd", action = "append", default = None,
+                        help="cmd to run on each switch (fan-out, repeatable)")
+    parser.add_argument("-j", "--jobs", type = int, default = 16,
+                        help="max switches worked on in parallel (fan-out), "
+                             "copies going out of this machine (with -f)")
+    parser.add_argument("--batch", action = "store_true",
+                        help="pipeline fan-out cmds, one round trip per switch")
+    parser.add_argument("--async", action = "store_true", dest = "use_async",
+                        help="drive fan-out sessions from one asyncio loop")
+    parser.add_argument("-b", "--backend", default = "pexpect",
+                        choices = ["pexpect", "paramiko"],
+                        help="fan-out session: ssh child on pty or in-process")
     # choices=[0, 1, 2, 3, 4, 5, 6, 7] is -v=0..7, count is -v, -vv, -vvv
     parser.add_argument("-v", "--verbose", action="count",
                         help="increase script output verbosity")
@@ -56,11 +77,52 @@ def parse_args():
                         help="switch name/ip to connect")
 
     g_args = parser.parse_args()
-    if ((g_args.switch == None) or (g_args.user == None) or
-        (g_args.passwd == None)):
+    g_args.host_list = read_hosts(g_args.hosts, g_args.hosts_file)
+    if (((g_args.switch == None) and (not g_args.host_list)) or
+        (g_args.user == None) or (g_args.passwd == None)):
         print("Unknown switch IP/FQDN or username or password. Use --help")
         sys.exit(1)
 
+def read_hosts(hosts, hosts_file):
+    host_list = []
+    if hosts is not None:
+        host_list += [h.strip() for h in hosts.split(',') if h.strip()]
+    if hosts_file is not None:
+        with open(hosts_file) as f:
+            for line in f:
+                line = line.split('#', 1)[0].strip()   # skip comments, blanks
+                if line:
+                    host_list.append(line)
+    # drop duplicates, keep order given by user
+    return list(dict.fromkeys(host_list))
+
+def fanout():
+    global g_args
+
+    fan = SSHFanout(g_args.host_list, g_args.cmd, user = g_args.user,
+                    passwd = g_args.passwd, method = g_args.method,
+                    port = g_args.port, jobs = g_args.jobs,
+                    batch = g_args.batch,
+                    conn_cls = ParamikoConnect if g_args.backend == "paramiko"
+                               else None)
+    # exec channels do not block on a pty, threads are enough for them
+    if g_args.use_async is True and g_args.backend == "pexpect":
+        fan.run_async()
+    else:
+        fan.run()
+    return fan.report()
+
+def distribute():
+    global g_args
+
+    dist = SCPDistribute(g_args.host_list, g_args.fpath, rpath = g_args.rpath,
+                         rec = os.path.isdir(g_args.fpath),
+                         user = g_args.user, passwd = g_args.passwd,
+                         port = g_args.port, jobs = g_args.jobs,
+                         relay = g_args.relay, streams = g_args.streams)
+    dist.run()
+    return dist.report()
+
 def copy():
     global g_args
 
@@ -70,7 +132,9 @@ def copy():
                                   passwd = g_args.passwd,
                                   lpath = g_args.fpath,
                                   rec = recursive,
-                                  rpath = g_args.rpath)
+                                  rpath = g_args.rpath,
+                                  port = g_args.port,
+                                  streams = g_args.streams)
 
     #print(globs.g_conn_hdl.cli_out)
 
@@ -103,10 +167,16 @@ def main():
     globs.init_vars(os.path.splitext(os.path.basename(__file__))[0])
     parse_args()
     #log_init(g_args.log.upper())          #log_conf_init()
-    globs.g_logger = Logger(logName = globs.g_script_name)
+    # fan-out sessions log from many threads, keep log I/O off those threads
+    globs.g_logger = Logger(logName = globs.g_script_name,
+                            asyncLog = bool(g_args.host_list))
     if (g_args.verbose != None) and (g_args.verbose >= 2):
         print ("g_args: ", g_args)
-        dump_python_details()
+        globs.dump_python_details()
+    if g_args.host_list and g_args.fpath is not None:
+        sys.exit(1 if distribute() else 0)
+    if g_args.host_list:
+        sys.exit(1 if fanout() else 0)
     copy()
     connect()
     globs.g_conn_hdl.interact()         # globs.g_conn_hdl.handle.interact()
@@ -10,18 +10,17 @@
 # Always leave the code you're editing a little better than you found it
 
 # Import all required modules
-import struct, fcntl, glob, os, sys, signal
-import argparse, pexpect, pdb, logging
+# pexpect, pdb & logging.config are imported where used, keeps --help quick
+import struct, fcntl, os, sys
+import argparse, logging
 import logging.handlers as hdlrs
-import logging.config as config
-from pexpect import pxssh
 
 global g_logger
 
 # global declarations. no need for %(name)s as log-name has name of script
 LOG_FORMAT='%(asctime)s.%(msecs)03d :%(levelname)s %(funcName)s:%(lineno)d %(message)s'
 DATE_FORMAT='%m/%d/%Y %H:%M:%S'
-MAX_LOG_SIZE = 60       #10240     # 10KB
+MAX_LOG_SIZE = 10485760 # 10MB, tiny sizes rename log file on almost every line
 MAX_LOG_BKUP = 3
 
 def dump_python_details():
@@ -88,6 +87,7 @@ def log_init(arg_log_level = "DEBUG"):
     g_logger.critical("===============Init logs. path: %s=================", log_file)
 
 def log_conf_init():
+    import logging.config as config
     conf_path = os.getenv('CUST_CONFS', default=os.getcwd()) + "/logging.conf"
     print ("conf_path: ", conf_path)
     if (not os.path.exists(conf_path)):
@@ -130,6 +130,8 @@ def parse_args():
 
 def connect():
     global args
+    import pdb
+    from pexpect import pxssh
 
     if (args.method == "ssh"):
         #spawncmd = 'ssh ' + args.user + '@' + args.switch
@@ -1,6 +1,28 @@
 #!/usr/bin/python
 
-import struct, fcntl, glob, time, sys, os, re, signal
+import struct, fcntl, sys, os, types, importlib, importlib.util
+
+class LazyModule(types.ModuleType):
+    # stands in for module till first attribute access, see lazy_import()
+    def __getattr__(self, attr):
+        mod = importlib.import_module(self.__name__)
+        self.__dict__.update(mod.__dict__)  # later lookups skip __getattr__
+        return getattr(mod, attr)
+
+def lazy_import(name, optional = False):
+    """
+    Returns module 'name', imported only when an attribute of it is first
+    used, so scripts do not pay at startup for modules that only some code
+    paths need (even --help used to). With optional, None is returned if
+    module is not installed, checked without importing it.
+        pexpect = globs.lazy_import('pexpect')
+        paramiko = globs.lazy_import('paramiko', optional = True)
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    if optional is True and importlib.util.find_spec(name) is None:
+        return None
+    return LazyModule(name)
 
 def dump_python_details():
     print ("\n", "sys.path:", sys.path)
@@ -33,6 +55,7 @@ def create_path(path, isdir=None):
         os.mkfile(path)
 
 def sigwinch_passthrough (sig, data):
+    import termios
     # Check for buggy platforms (see pexpect.setwinsize()).
     if 'TIOCGWINSZ' in dir(termios):
         TIOCGWINSZ = termios.TIOCGWINSZ
@@ -53,11 +76,15 @@ def init_vars(script_name):
     global g_log_date_fmt
     global g_log_max_sz
     global g_log_bkup_cnt
+    global g_log_rotate_secs
+    global g_log_disk_budget
 
     # no need for %(name)s as log-name has name of script
     g_script_name = script_name if script_name != None else os.path.splitext(os.path.basename(__file__))[0]
     g_log_msg_fmt = '%(asctime)s.%(msecs)03d (%(threadName)-10s) %(funcName)s:%(lineno)d %(levelname)s %(message)s'
     g_log_date_fmt = '%m/%d/%Y %H:%M:%S'            # '%m/%d/%Y %I:%M:%S %p'
-    g_log_max_sz = 10240                            # 10KB
-    g_log_bkup_cnt = 1
+    g_log_max_sz = 10485760                         # 10MB
+    g_log_bkup_cnt = 20                             # gzip'ed, see LogRotator
+    g_log_rotate_secs = 86400                       # daily, 0 for size only
+    g_log_disk_budget = 104857600                   # 100MB for rotated logs
     #print("Global variables initialized")
@@ -2,12 +2,24 @@
 
 __author__ = 'Ravikiran KS'
 
-import struct, fcntl, glob, time, sys, os, re, signal
-import argparse, pexpect, pdb, logging, globs
-#import paramiko
+import time, sys, os, re, codecs, random
+import bisect, socket, select, shlex, posixpath
+import logging, threading, queue, atexit
+import globs
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from concurrent.futures import FIRST_COMPLETED
 #from pexpect import pxssh
 import logging.handlers as handlers
-import logging.config as config
+#import logging.config as config
+# loaded on first use, most scripts touch only a few of these code paths
+pexpect = globs.lazy_import('pexpect')
+asyncio = globs.lazy_import('asyncio')
+gzip = globs.lazy_import('gzip')                # LogRotator
+shutil = globs.lazy_import('shutil')
+json = globs.lazy_import('json')                # SessionStats
+hashlib = globs.lazy_import('hashlib')          # SCPConnect
+paramiko = globs.lazy_import('paramiko', optional = True) # ParamikoConnect
 
 """
 Access logger APIs as below
@@ -15,10 +27,123 @@ self.logger.info(" " + str(line))  # self.logger.log(logging.INFO, *)
 self.logger.warn(line)             # self.logger.log(logging.WARNING, *)
 self.logger.error(str(line))       # self.logger.log(logging.ERROR, *)
 self.logger.debug(line)            # self.logger.log(logging.DEBUG, *)
+
+With asyncLog = True, records are put on an in-memory queue and a single
+background thread does formatting and tty/file I/O, so callers never block
+on log I/O. Queue is drained at exit, or explicitly with stop().
 """
+class LineFormatter(logging.Formatter):
+    # records from Logger.new_line() come out as bare blank lines. Avoids
+    # swapping formatters on shared handlers, which races across threads.
+    def format(self, record):
+        if getattr(record, 'nil_line', False) is True:
+            return ''
+        return super(LineFormatter, self).format(record)
+
+class LogRotator(handlers.BaseRotatingHandler):
+    """
+    File handler rotating on size (maxBytes) and/or age (rotateSecs). Caller
+    only pays for a rename on rollover. Rotated files are gzip'ed on a
+    background thread, which also keeps at most backupCount of them and
+    deletes oldest ones till all of them fit in diskBudget bytes.
+    """
+    def __init__(self, filename, maxBytes = 0, rotateSecs = 0,
+                 backupCount = 0, diskBudget = 0):
+        super(LogRotator, self).__init__(filename, 'a', delay = False)
+        self.maxBytes = maxBytes
+        self.rotateSecs = rotateSecs
+        self.backupCount = backupCount
+        self.diskBudget = diskBudget
+        self.rolloverAt = time.time() + rotateSecs if rotateSecs else None
+        self.rotated = re.compile(re.escape(os.path.basename(filename)) +
+                                  '\\.\\d{8}-\\d{6}(\\.\\d+)?$')
+        self.zipQ = queue.SimpleQueue()
+        self.zipper = threading.Thread(target = self.compress_loop,
+                                       name = 'logzip', daemon = True)
+        self.zipper.start()
+        for path in self.backups(gz = False):  # left over from earlier run
+            self.zipQ.put(path)
+
+    def backups(self, gz = True):
+        # rotated files of this log, oldest first (names carry timestamp)
+        logDir = os.path.dirname(self.baseFilename)
+        paths = []
+        for name in os.listdir(logDir):
+            base = name[:-3] if gz is True and name.endswith('.gz') else name
+            if (gz is False or base != name) and self.rotated.match(base):
+                stamp = base[len(os.path.basename(self.baseFilename)) + 1:]
+                cnt = stamp.split('.')                # stamp[.count]
+                key = (cnt[0], int(cnt[1]) if len(cnt) > 1 else 0)
+                paths.append((key, os.path.join(logDir, name)))
+        return [path for key, path in sorted(paths)]
+
+    def shouldRollover(self, record):
+        if self.stream is None:
+            self.stream = self._open()
+        if self.maxBytes > 0 and self.stream.tell() >= self.maxBytes:
+            return True
+        if self.rolloverAt is not None and time.time() >= self.rolloverAt:
+            return True
+        return False
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        dst = '%s.%s' % (self.baseFilename, time.strftime('%Y%m%d-%H%M%S'))
+        cnt = 0
+        while os.path.exists(dst) or os.path.exists(dst + '.gz'):
+            cnt += 1
+            dst = '%s.%s.%d' % (self.baseFilename,
+                                time.strftime('%Y%m%d-%H%M%S'), cnt)
+        if os.path.exists(self.baseFilename):
+            os.rename(self.baseFilename, dst)
+            self.zipQ.put(dst)
+        self.stream = self._open()
+        if self.rolloverAt is not None:
+            self.rolloverAt = time.time() + self.rotateSecs
+
+    def compress_loop(self):
+        while True:
+            path = self.zipQ.get()
+            if path is None:
+                return
+            try:
+                with open(path, 'rb') as fin:
+                    with gzip.open(path + '.gz.tmp', 'wb') as fout:
+                        shutil.copyfileobj(fin, fout)
+                os.rename(path + '.gz.tmp', path + '.gz')
+                os.unlink(path)
+                self.prune()
+            except OSError as e:
+                print ("ERR: compress of log %s failed: %s" % (path, e))
+
+    def prune(self):
+        paths = self.backups()
+        if self.backupCount > 0:
+            for path in paths[:-self.backupCount]:
+                os.unlink(path)
+            paths = paths[-self.backupCount:]
+        if self.diskBudget > 0:
+            sizes = [os.path.getsize(path) for path in paths]
+            try:                        # live log may be mid-rollover
+                total = sum(sizes) + os.path.getsize(self.baseFilename)
+            except OSError:
+                total = sum(sizes)
+            while paths and total > self.diskBudget:
+                os.unlink(paths.pop(0))
+                total -= sizes.pop(0)
+
+    def close(self):
+        # let pending compressions finish, logging.shutdown() calls at exit
+        if self.zipper.is_alive():
+            self.zipQ.put(None)
+            self.zipper.join()
+        super(LogRotator, self).close()
+
 class Logger():
     def __init__(self, logName = None, logLvl = logging.INFO, toFile = False,
-                 ttyLvl = logging.DEBUG):
+                 ttyLvl = logging.DEBUG, asyncLog = False):
         self.logPath = os.getenv('SCRPT_LOGS',
                                  default=os.path.join(os.getcwd()))
         globs.create_path(self.logPath, True)
@@ -35,20 +160,33 @@ class Logger():
         logFile = self.logPath + '/' + logName + '.log'
         self.logger = logging.getLogger(logName)
         self.logger.setLevel(logLvl)
+        self.listener = None
         #print ("logFile:", logFile, "logLvl:", logLvl)
 
         try:
-            self.logFmt = logging.Formatter(fmt = globs.g_log_msg_fmt,
-                                               datefmt = globs.g_log_date_fmt)
-            self.nilFmt = logging.Formatter(fmt = '')
+            self.logFmt = LineFormatter(fmt = globs.g_log_msg_fmt,
+                                        datefmt = globs.g_log_date_fmt)
+            hdls = []
 
             if toFile is True:
                 self.fileHdl = self.create_loghandler(logLvl, logFile)
-                self.logger.addHandler(self.fileHdl)
+                hdls.append(self.fileHdl)
 
             self.ttyHdl = self.create_loghandler(ttyLvl) # create console logger
-            self.logger.addHandler(self.ttyHdl)
-            #self.nilHdl = self.create_loghandler(ttyLvl, fmt = '')
+            hdls.append(self.ttyHdl)
+            self.hdls = hdls
+
+            if asyncLog is True:
+                # handlers hang off queue listener thread instead of logger
+                self.logQ = queue.SimpleQueue()
+                self.logger.addHandler(handlers.QueueHandler(self.logQ))
+                self.listener = handlers.QueueListener(self.logQ, *hdls,
+                                                respect_handler_level = True)
+                self.listener.start()
+                atexit.register(self.stop)
+            else:
+                for hdl in hdls:
+                    self.logger.addHandler(hdl)
 
             self.create_aliases()
             self.info("Logger configured")          # same as self.logger.info
@@ -63,9 +201,10 @@ class Logger():
     def create_loghandler(self, lvl = logging.DEBUG, log = None, fmt = None):
         if (log):   # file log handler
             # Instead of regular FileHandler(), create Rotating FileHandler
-            hdl = handlers.RotatingFileHandler(log,
-                                               maxBytes=globs.g_log_max_sz,
-                                               backupCount=globs.g_log_bkup_cnt)
+            hdl = LogRotator(log, maxBytes = globs.g_log_max_sz,
+                             rotateSecs = globs.g_log_rotate_secs,
+                             backupCount = globs.g_log_bkup_cnt,
+                             diskBudget = globs.g_log_disk_budget)
         else:           # console log handler
             hdl = logging.StreamHandler()
 
@@ -82,6 +221,7 @@ class Logger():
         self.warning = self.logger.warning
         self.debug = self.logger.debug
         self.critical = self.logger.critical
+        self.isEnabledFor = self.logger.isEnabledFor
 
     def set_log_lvl(self, lvl = logging.DEBUG, is_tty = False):
         if is_tty is False:
@@ -90,29 +230,162 @@ class Logger():
             self.ttyHdl.setLevel(lvl)
 
     def new_line(self, nlines = 1):
-        self.ttyHdl.setFormatter(self.nilFmt)
+        # skip making records no handler would write (quiet tty, no file)
+        if all(hdl.level > logging.CRITICAL for hdl in self.hdls):
+            return
         for i in range(nlines):
-            self.critical('')
-        self.ttyHdl.setFormatter(self.logFmt)
+            self.critical('', extra = {'nil_line': True})
+
+    def stop(self):
+        # drain queued records and stop writer thread (async mode only)
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+class SessionStats():
+    """
+    Per host, per phase latency histograms of SSHConnect and friends. Phases
+    are spawn, connect (copy for SCPConnect), send_exp, batch and one per
+    expect() outcome: prompt, yesno, passwd, expr, timeout, eof, unknown.
+    Recording is a bisect & two adds under a lock, cheap enough to leave on.
+    If SCRPT_METRICS names a dir, JSON & Prometheus textfile dumps of all
+    histograms are written there at exit.
+    """
+    buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30,
+               60, 300, 1500)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hists = {}         # (host, phase) -> [bucket counts, sum, count]
+        self.path = os.getenv('SCRPT_METRICS', default = None)
+        if self.path is not None:
+            atexit.register(self.dump)
+
+    def observe(self, host, phase, secs):
+        idx = bisect.bisect_left(self.buckets, secs)
+        with self.lock:
+            hist = self.hists.get((host, phase))
+            if hist is None:
+                hist = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self.hists[(host, phase)] = hist
+            hist[0][idx] += 1
+            hist[1] += secs
+            hist[2] += 1
+
+    def as_dict(self):
+        with self.lock:
+            hists = dict((k, (list(v[0]), v[1], v[2]))
+                         for k, v in self.hists.items())
+        out = {}
+        for (host, phase), (counts, total, cnt) in sorted(hists.items()):
+            out.setdefault(host, {})[phase] = {
+                'count': cnt, 'sum': total,
+                'buckets': dict(zip([str(b) for b in self.buckets] + ['+Inf'],
+                                    counts))}
+        return out
+
+    def dump_json(self, path):
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.as_dict(), f, indent = 1, sort_keys = True)
+        os.rename(path + '.tmp', path)
+
+    def dump_prom(self, path):
+        # textfile collector needs whole file to appear at once, so rename
+        name = 'scrpt_session_phase_seconds'
+        lines = ['# HELP %s SSHConnect per phase latency' % (name),
+                 '# TYPE %s histogram' % (name)]
+        esc = lambda v: v.replace('\\', '\\\\').replace('"', '\\"')
+        for host, phases in self.as_dict().items():
+            for phase, hist in phases.items():
+                lbl = 'host="%s",phase="%s"' % (esc(host), esc(phase))
+                cum = 0
+                for le, cnt in hist['buckets'].items():
+                    cum += cnt
+                    lines.append('%s_bucket{%s,le="%s"} %d' %
+                                 (name, lbl, le, cum))
+                lines.append('%s_sum{%s} %f' % (name, lbl, hist['sum']))
+                lines.append('%s_count{%s} %d' % (name, lbl, hist['count']))
+        with open(path + '.tmp', 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.rename(path + '.tmp', path)
+
+    def dump(self, path = None):
+        path = self.path if path is None else path
+        globs.create_path(path, True)
+        name = getattr(globs, 'g_script_name', 'scrpt')
+        self.dump_json(os.path.join(path, name + '.metrics.json'))
+        self.dump_prom(os.path.join(path, name + '.prom'))
+
+class HostLatency():
+    """
+    Learns connect & cmd latency of each host, smoothed mean and deviation
+    like TCP does for its RTO, and derives timeouts from them: margin times
+    (mean + 4 * deviation), clamped to [floor, cap]. Hosts with fewer than
+    min_samples get cap, so first contact is never cut short.
+    """
+    def __init__(self, margin = 3, min_samples = 3):
+        self.margin = margin
+        self.min_samples = min_samples
+        self.lock = threading.Lock()
+        self.est = {}           # (host, kind) -> [mean, deviation, samples]
+
+    def update(self, host, kind, secs):
+        with self.lock:
+            est = self.est.get((host, kind))
+            if est is None:
+                self.est[(host, kind)] = [secs, secs / 2, 1]
+                return
+            est[1] = 0.75 * est[1] + 0.25 * abs(est[0] - secs)
+            est[0] = 0.875 * est[0] + 0.125 * secs
+            est[2] += 1
+
+    def timeout(self, host, kind, floor, cap):
+        with self.lock:
+            est = self.est.get((host, kind))
+        if est is None or est[2] < self.min_samples:
+            return cap
+        return min(cap, max(floor, self.margin * (est[0] + 4 * est[1])))
 
 class SSHConnect():
+    autoconnect = True          # login from __init__(), see AsyncSSHConnect
+    cache_pats = True           # reuse compiled expect() pattern lists
+    pat_cache = {}              # (prompt, expr, str type, case) -> (patterns,
+                                # compiled patterns)
+    stats = SessionStats()      # latency histograms, None to turn off
+    latency = HostLatency()     # learnt latencies, None for fixed timeouts
+    conn_floor = 10             # least connect timeout, when adaptive
+    idle_floor = 30             # least secs of cmd silence before giving up
+    intr_timeout = 10           # secs to wait for prompt after Ctrl-C
+    backoff_base = 1            # secs before 1st retry, doubles each retry
+    backoff_cap = 30
+    conn_phase = 'connect'
+    exp_phases = ('timeout', 'prompt', 'yesno', 'passwd', 'eof', 'passwd',
+                  'expr')
+
     def __init__(self, host, user = 'admin', passwd = None, method = None,
-                 port = None, timeout = 1500, retry = 2, logger = None):
+                 port = None, timeout = 1500, retry = 2, logger = None,
+                 quiet = False, conn_timeout = 60):
         self.host = host
         self.user = user
         self.passwd = passwd
         self.handle = None
-        self.timeout = timeout
-        self.retry = retry
+        self.timeout = timeout              # hard limit for a cmd
+        self.conn_timeout = conn_timeout    # hard limit for login dialogue
+        self.retry = retry                  # connect retries, with backoff
         self.method = 'ssh' if method is None else method
         self.port = 22 if port is None else port
         self.vsh_prompt = ".*[>|%]"
         self.prompt = "@.*[\$|\#]"
+        # quiet sessions do not tee device output to stdout (used by fan-out)
+        self.logfile = None if quiet is True else sys.stdout.buffer
         # self.logger = globs.g_logger works due to aliases in Logger
         self.logger = logger if logger != None else globs.g_logger
-        self.connect()      # no explicit call to connect()
+        self.npasswd = 0                    # password prompts in an expect()
+        self.connected = False
+        if self.autoconnect is True:
+            self.connected = self.connect() # no explicit call to connect()
 
-    def connect(self, cmd = None):
+    def spawn(self, cmd = None):
         if cmd is None:
             # 'ssh %s@%s' also works, but below one works for both telnet, ssh
             cmd = '%s -l %s %s' % (self.method, self.user, self.host)
@@ -123,26 +396,134 @@ class SSHConnect():
 
         try:
             self.last_cmd = cmd
+            start = time.monotonic()
             self.handle = pexpect.spawn(cmd, timeout = self.timeout,
                                         maxread = 65535, echo = False,
-                                        logfile = sys.stdout.buffer)
+                                        logfile = self.logfile)
+            self.observe('spawn', start)
             #self.handle.logfile = open(globs.g_script_name + ".log", "w")
         except Exception as e:
-            self.logger.error("Error " + e + " connecting to host " + self.host)
+            self.logger.error("Error %s connecting to host %s" % (e, self.host))
             return False
+        return True
 
-        ret = self.expect()
-        msg = 'successful' if ret is True else 'failed'
-        self.logger.info("Running above cmd %s " % (msg))
-        return ret
+    def observe(self, phase, start):
+        if self.stats is not None:
+            self.stats.observe(self.host, phase, time.monotonic() - start)
+
+    def exp_phase(self, idx, expr = None):
+        if idx < len(self.exp_phases) and (idx < 6 or expr is not None):
+            return self.exp_phases[idx]
+        return 'unknown'
+
+    def conn_tmo(self):
+        if self.latency is None:
+            return self.conn_timeout
+        return self.latency.timeout(self.host, self.conn_phase,
+                                    self.conn_floor, self.conn_timeout)
+
+    def idle_tmo(self, idle = False):
+        # secs without any output after which a cmd is taken as wedged.
+        # Opt in per cmd: True uses the learnt cmd latency, a number is used
+        # as is, False/None waits for the full timeout.
+        if idle is None or idle is False:
+            return None
+        if idle is not True:
+            return idle
+        if self.latency is None:
+            return None
+        return self.latency.timeout(self.host, 'cmd', self.idle_floor,
+                                    self.timeout)
+
+    def backoff(self, attempt):
+        # exponential backoff with jitter, so retries of many hosts spread out
+        delay = min(self.backoff_cap, self.backoff_base * 2 ** (attempt - 1))
+        return delay * random.uniform(0.5, 1.5)
+
+    def connect_ok(self, ret):
+        # login is done only if ssh is still alive at prompt
+        return ret is True and self.is_up()
+
+    def connect_done(self, attempt, ret, start):
+        # book keeping after a login attempt. True if no retry is needed.
+        secs = time.monotonic() - start
+        self.observe(self.conn_phase, start)
+        ok = self.connect_ok(ret)
+        if ok and self.latency is not None:
+            self.latency.update(self.host, self.conn_phase, secs)
+        msg = 'successful' if ok else 'failed'
+        self.logger.info("Running above cmd %s (attempt %d of %d, %.1fs)" %
+                         (msg, attempt + 1, self.retry + 1, secs))
+        if not ok and self.npasswd > 2:
+            self.logger.error("Login to host %s rejected, not retrying" %
+                              (self.host))
+            return True
+        return ok
+
+    def connect(self, cmd = None):
+        ok = False
+        for attempt in range(self.retry + 1):
+            if attempt > 0:
+                self.close()
+                delay = self.backoff(attempt)
+                self.logger.info("Retry host %s in %.1fs" % (self.host, delay))
+                time.sleep(delay)
+            start = time.monotonic()
+            if self.spawn(cmd) is False:
+                continue
+            ret = self.expect(timeout = self.conn_tmo())
+            if self.connect_done(attempt, ret, start) is True:
+                ok = self.connect_ok(ret)
+                break
+        return ok
 
     def is_up(self):
         if self.handle is None:
             return False
-        return True
+        return self.handle.isalive()
+
+    def close(self):
+        if self.handle is not None:
+            self.handle.close()
+            self.handle = None
+
+    def output(self):
+        # text between sent cmd and matched prompt, i.e. output of last cmd.
+        # Prompt is matched from '@', so drop user part of it left at the end.
+        if self.handle is None:
+            return ''
+        out, after = self.handle.before, self.handle.after
+        if isinstance(out, bytes):
+            out = out.decode(errors = 'replace')
+        if isinstance(after, bytes):
+            after = after.decode(errors = 'replace')
+        if not isinstance(after, str):          # timeout or EOF
+            return out
+        head, nl, tail = out.rpartition('\n')
+        for cprompt in (self.prompt, self.vsh_prompt):
+            if re.fullmatch('\\S*' + cprompt, tail + after):
+                return head + nl
+        return out
+
+    def probe(self, timeout = 5, isvsh = False):
+        # cheap round trip to check that session still answers at its prompt
+        if not self.is_up():
+            return False
+        if self.send_line('') is False:
+            return False
+        return self.expect(isvsh = isvsh, timeout = timeout) and self.is_up()
 
-    def expect(self, expr = None, isvsh = False, no = False):
+    def expect_pats(self, expr = None, isvsh = False):
         cprompt = self.prompt if isvsh is False else self.vsh_prompt
+        pats, cpats = self.compile_pats(cprompt, expr)
+        self.last_expr = pats
+        self.npasswd = 0
+        self.logger.new_line()
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("Expect: %s" % (str(pats)[1:-1]))
+        return cpats
+
+    def build_pats(self, cprompt, expr):
         pats = [pexpect.TIMEOUT, cprompt, '[\(|\[]*[Y|y]es[/|,][N|n]o[\)|\]]*',
                 '[P|p]assword:', pexpect.EOF, 'admin:']
         if expr is not None:
@@ -151,63 +532,148 @@ class SSHConnect():
 #        if isvsh is True:
 #            pats.append()
 
-        self.last_expr = pats
-        self.logger.new_line()
-        self.logger.debug("Expect: %s" % (str(pats)[1:-1]))
+        return pats
 
-        while True:
-            idx = self.handle.expect(pats, timeout = self.timeout)
-            if idx == 0:  # timeout
-                self.exp_out = str(self.handle.after)
-                self.logger.new_line()
-                self.logger.info("expect timeout for cmd %s on host %s" %
-                                    (self.last_cmd, self.host))
+    def compile_pats(self, cprompt, expr):
+        # (patterns, compiled patterns). pexpect compiles every regex on each
+        # expect() call. Patterns only vary by prompt & expr, so build &
+        # compile once & share across sessions; a hit is one dict lookup.
+        if self.cache_pats is False:
+            pats = self.build_pats(cprompt, expr)
+            return pats, self.handle.compile_pattern_list(pats)
+        key = (cprompt, expr, self.handle.string_type, self.handle.ignorecase)
+        try:
+            ent = SSHConnect.pat_cache.get(key)
+        except TypeError:               # unhashable expr, cannot cache
+            pats = self.build_pats(cprompt, expr)
+            return pats, self.handle.compile_pattern_list(pats)
+        if ent is None:
+            pats = self.build_pats(cprompt, expr)
+            ent = (pats, self.handle.compile_pattern_list(pats))
+            SSHConnect.pat_cache[key] = ent
+        return ent
+
+    def expect_idx(self, idx, expr = None, no = False):
+        # act on index of matched pattern. None means keep expecting.
+        if idx == 0:  # timeout
+            self.exp_out = str(self.handle.after)
+            self.logger.new_line()
+            self.logger.info("expect timeout for cmd %s on host %s" %
+                                (self.last_cmd, self.host))
+            return False
+
+        elif idx == 1:  # prompt received
+            self.cli_out = str(self.handle.after)
+            self.logger.new_line()
+            self.logger.debug("Bash prompt seen on host " + self.host)
+            if expr is None:
+                return True
+            return None
+
+        elif idx == 2:  # yes/no question
+            self.logger.new_line()
+            self.logger.debug("Yes/No prompt seen on host " + self.host)
+            ans = 'no' if no is True else 'yes'
+            if self.send_line(ans) is False:
+                return False
+            return None
+
+        elif idx == 3 or idx == 5:  # passwd prompt
+            self.logger.new_line()
+            self.logger.debug("Pass prompt seen on host " + self.host)
+            self.npasswd += 1
+            if self.npasswd > 2:    # asked again & again, password is wrong
+                self.logger.info("Password rejected by host " + self.host)
+                return False
+            if self.send_line(self.passwd) == False:
                 return False
+            return None
 
-            elif idx == 1:  # prompt received
+        elif idx == 4:  # EOF reached, spawned process has died
+            self.logger.new_line()
+            self.logger.debug("EOF reached on ssh to host " + self.host)
+            return True
+
+        else:
+            if (idx == 6) and (expr is not None):  # input pattern
                 self.cli_out = str(self.handle.after)
                 self.logger.new_line()
-                self.logger.debug("Bash prompt seen on host " + self.host)
-                if expr is None:
-                    return True
-                continue
-
-            elif idx == 2:  # yes/no question
+                self.logger.debug("Pattern %s seen on host %s" %
+                                (expr, self.host))
+                return True
+            else:
+                self.cli_out = str(self.handle.before)
+                self.exp_out = str(self.handle.after)
                 self.logger.new_line()
-                self.logger.debug("Yes/No prompt seen on host " + self.host)
-                ans = 'no' if no is True else 'yes'
-                if self.send_line(ans) is False:
-                    return False
-                continue
+                self.logger.info("Unknown error for cmd %s on host %s" %
+                                (self.last_cmd, self.host))
+                return False
 
-            elif idx == 3 or idx == 5:  # passwd prompt
-                self.logger.new_line()
-                self.logger.debug("Pass prompt seen on host " + self.host)
-                if self.send_line(self.passwd) == False:
-                    return False
-                continue
+    def expect_wait(self, deadline, idle):
+        # wait for next expect_list(), idle bounds the wait for more output
+        wait = max(deadline - time.monotonic(), 0)
+        return wait if idle is None else min(wait, idle)
 
-            elif idx == 4:  # EOF reached, spawned process has died
-                self.logger.new_line()
-                self.logger.debug("EOF reached on ssh to host " + self.host)
-                return True
+    def expect_busy(self, idx, deadline, idle, seen):
+        # on idle timeout before deadline, keep waiting if output has grown.
+        # Unmatched output stays in handle.buffer, so its size is progress.
+        if idx != 0 or idle is None or time.monotonic() >= deadline:
+            return None
+        size = len(self.handle.buffer)
+        return size if size != seen else None
 
-            else:
-                if (idx == 6) and (expr is not None):  # input pattern
-                    self.cli_out = str(self.handle.after)
-                    self.logger.new_line()
-                    self.logger.debug("Pattern %s seen on host %s" %
-                                    (expr, self.host))
-                    return True
-                else:
-                    self.cli_out = str(self.handle.before)
-                    self.exp_out = str(self.handle.after)
-                    self.logger.new_line()
-                    self.logger.info("Unknown error for cmd %s on host %s" %
-                                    (cmd, self.host))
-                    return False
+    def idle_abort(self, idx, deadline, idle):
+        # expect gave up on a silent cmd before its timeout
+        return idx == 0 and idle is not None and time.monotonic() < deadline
 
-        return True
+    def interrupt_pats(self, isvsh):
+        # Ctrl-C the wedged cmd and return patterns to wait for prompt with,
+        # so next cmd does not read the tail of this one
+        self.logger.new_line()
+        self.logger.info("No output for cmd %s on host %s, interrupting" %
+                         (self.last_cmd, self.host))
+        cprompt = self.prompt if isvsh is False else self.vsh_prompt
+        self.handle.sendcontrol('c')
+        return self.compile_pats(cprompt, None)[1]
+
+    def interrupted(self, idx):
+        if idx != 1:
+            self.logger.info("Prompt not back after interrupt on host %s" %
+                             (self.host))
+        return False
+
+    def interrupt(self, isvsh):
+        try:
+            cpats = self.interrupt_pats(isvsh)
+            return self.interrupted(self.handle.expect_list(cpats,
+                                            timeout = self.intr_timeout))
+        except Exception as e:
+            self.logger.info("Exception %s seen on interrupt on host %s" %
+                             (e, self.host))
+            return False
+
+    def expect(self, expr = None, isvsh = False, no = False, timeout = None,
+               idle = None):
+        pats = self.expect_pats(expr, isvsh)
+        deadline = time.monotonic() + (self.timeout if timeout is None
+                                       else timeout)
+        seen = len(self.handle.buffer)
+        start = time.monotonic()
+        while True:
+            idx = self.handle.expect_list(pats,
+                                          timeout = self.expect_wait(deadline,
+                                                                     idle))
+            busy = self.expect_busy(idx, deadline, idle, seen)
+            if busy is not None:
+                seen = busy
+                continue
+            self.observe(self.exp_phase(idx, expr), start)
+            ret = self.expect_idx(idx, expr, no)
+            if self.idle_abort(idx, deadline, idle):
+                return self.interrupt(isvsh)
+            if ret is not None:
+                return ret
+            start = time.monotonic()
 
     def send_line(self, cmd):
         self.last_cmd = cmd
@@ -219,19 +685,169 @@ class SSHConnect():
         try:
             self.handle.sendline(cmd)
         except Exception as e:
-            self.logger.info("Exception" + e + "seen for sendline of" + cmd +
-                             " on host" + self.host)
+            self.logger.info("Exception %s seen for sendline of %s on host %s"
+                             % (e, cmd, self.host))
             return False
 
         return True
 
-    def send_exp(self, cmd, expr = None, isvsh = False):
-        self.send_line(cmd)
+    def send_exp(self, cmd, expr = None, isvsh = False, timeout = None,
+                 idle = False):
+        # idle opts in to giving up early on a cmd that has gone silent
+        start = time.monotonic()
+        if self.send_line(cmd) is False:
+            return False
         # expect() does job of self.handle.read() and more
-        self.expect(expr = expr, isvsh = isvsh)
+        ret = self.expect(expr = expr, isvsh = isvsh, timeout = timeout,
+                          idle = self.idle_tmo(idle))
+        self.observe('send_exp', start)
+        if ret is True and self.latency is not None:
+            self.latency.update(self.host, 'cmd', time.monotonic() - start)
         tstr = '%s %s' % (self.handle.before, self.handle.after)
         #self.logger.debug("%s" % (tstr))           # print() is primitive
-        return True
+        return ret
+
+    def send_batch(self, cmds, isvsh = False, timeout = None):
+        """
+        Send all cmds back to back and read their outputs in one go, saving a
+        prompt round trip per cmd on high latency links. Each cmd is followed
+        by an echo of a unique marker and exit status, used to split combined
+        output per cmd. Needs a posix shell on far end. Returns list of (cmd,
+        status, output), status is None if marker of cmd never came back.
+        """
+        if not cmds:
+            return []
+        start = time.monotonic()
+        tag = 'SCRPT%012x' % (random.getrandbits(48))
+        # echoed marker cmd reads "<tag>""_<n>_", only its output is <tag>_<n>_
+        echo_tag = '"%s""_' % (tag)
+        for idx, cmd in enumerate(cmds):
+            if self.send_line(cmd) is False or \
+               self.send_line('echo %s%d_" $?' % (echo_tag, idx)) is False:
+                return [(c, None, '') for c in cmds]
+
+        tmo = self.timeout if timeout is None else timeout
+        # whole status line, so a status split across reads is not cut short
+        last = re.compile(('%s_%d_ (\\d+)\\r*\\n' %
+                           (tag, len(cmds) - 1)).encode())
+        idx = self.handle.expect_list([last, pexpect.TIMEOUT, pexpect.EOF],
+                                      timeout = tmo, searchwindowsize = 4096)
+        self.observe('batch', start)
+        data = self.handle.before + (self.handle.after if idx == 0 else b'')
+        if idx == 0:
+            self.expect(isvsh = isvsh, timeout = tmo)   # resync with prompt
+        else:
+            self.logger.info("batch %s for cmds on host %s" %
+                             ('timeout' if idx == 1 else 'EOF', self.host))
+
+        text = data.decode(errors = 'replace')
+        ansi_esc = re.compile('\x1b\\[[0-9;?]*[A-Za-z]')
+        prompt = re.compile('\\S*%s\\s*$' % (self.prompt if isvsh is False
+                                            else self.vsh_prompt))
+        results = []
+        start = 0
+        marks = {}
+        for m in re.finditer('%s_(\\d+)_ (\\d+)' % (tag), text):
+            marks[int(m.group(1))] = (start, m.start(), int(m.group(2)))
+            start = m.end()
+        for idx, cmd in enumerate(cmds):
+            if idx not in marks:
+                results.append((cmd, None, ''))
+                continue
+            begin, end, status = marks[idx]
+            out = []
+            echoed = False
+            for line in text[begin:end].splitlines():
+                line = ansi_esc.sub('', line).rstrip('\r')
+                if echo_tag in line:            # echo of marker cmd
+                    continue
+                if echoed is False and line.rstrip().endswith(cmd):
+                    echoed = True               # echo of cmd itself
+                    continue
+                out.append(line)
+            # prompts printed between cmds end up at edges of each output
+            while out and (not out[0].strip() or prompt.match(out[0])):
+                out.pop(0)
+            while out and (not out[-1].strip() or prompt.match(out[-1])):
+                out.pop()
+            results.append((cmd, status, '\n'.join(out)))
+        self.batch_out = results
+        return results
+
+    def send_stream(self, cmd, isvsh = False, lines = False, spill = None,
+                    chunk = 4096, window = 1024, timeout = None):
+        """
+        Send cmd and yield its output as it arrives, till prompt is seen.
+        Yields decoded text chunks, or whole lines if lines is True. Only the
+        last window bytes are held back to look for prompt, so memory stays
+        flat irrespective of output size. With spill (file path), raw output
+        is also written to that file. self.stream_ok tells how it ended.
+            for line in conn.send_stream('show config', lines = True):
+                parse(line)
+        """
+        self.stream_ok = False
+        cprompt = self.prompt if isvsh is False else self.vsh_prompt
+        # prompt is a whole line, so user@ in it does not leak into output
+        regex = re.compile(('(^|\n)\\S*' + cprompt).encode())
+        if self.send_line(cmd) is False:
+            return
+
+        deadline = time.time() + (self.timeout if timeout is None else timeout)
+        decoder = codecs.getincrementaldecoder('utf-8')(errors = 'replace')
+        logfile, self.handle.logfile = self.handle.logfile, None
+        fout = open(spill, 'wb') if spill is not None else None
+        # left over from last expect(), less blank after its prompt
+        pend = bytearray(self.handle.buffer.lstrip(b' \t'))
+        self.handle.buffer = b''
+        part = ''                               # incomplete line, lines mode
+        bol = False                             # pend starts at a new line
+
+        def emit(data, final = False):
+            nonlocal part
+            if fout is not None:
+                fout.write(data)
+            text = decoder.decode(data, final)
+            if lines is False:
+                return [text] if text else []
+            text = part + text
+            out = text.split('\n')
+            part = out.pop() if not final else ''
+            if final and out[-1] == '':
+                out.pop()
+            return [l[:-1] if l.endswith('\r') else l for l in out]  # pty \r\n
+
+        try:
+            while True:
+                nl = pend.rfind(b'\n')          # prompt can only be last line
+                m = regex.match(pend, max(nl, 0)) if nl >= 0 or bol else None
+                if m is not None:
+                    self.handle.before = b''
+                    self.handle.after = bytes(pend[m.end(1):m.end()])
+                    self.handle.buffer = bytes(pend[m.end():])
+                    yield from emit(bytes(pend[:m.end(1)]), True)
+                    self.stream_ok = True
+                    self.logger.debug("Prompt seen on host " + self.host)
+                    return
+                if len(pend) > window:          # prompt can only be in tail
+                    bol = pend[-window - 1] == ord('\n')
+                    yield from emit(bytes(pend[:-window]))
+                    del pend[:-window]
+                try:
+                    pend += self.handle.read_nonblocking(chunk,
+                                                 max(deadline - time.time(), 0))
+                except pexpect.TIMEOUT:
+                    self.logger.info("stream timeout for cmd %s on host %s" %
+                                     (cmd, self.host))
+                    yield from emit(bytes(pend), True)
+                    return
+                except pexpect.EOF:
+                    self.logger.debug("EOF reached on ssh to host " + self.host)
+                    yield from emit(bytes(pend), True)
+                    return
+        finally:
+            self.handle.logfile = logfile
+            if fout is not None:
+                fout.close()
 
     def interact(self):
         #signal.signal(signal.SIGWINCH, globs.sigwinch_passthrough)
@@ -242,62 +858,1040 @@ class SSHConnect():
             sys.exit(1)
 
 class SCPConnect(SSHConnect):
+    """
+    Copy lpath to host, whole copy is done from __init__() like a login.
+    By default it is one 'scp [-r]' child. With streams > 0, an in-process
+    engine (needs paramiko) does the copy instead:
+      - file whose sha256 matches remote copy is skipped
+      - file is written to <rpath>.part, chunks of chunk_size bytes are sent
+        in parallel over 'streams' ssh connections
+      - .part left by an earlier failed run is resumed, only chunks whose
+        sha256 differs from local chunk are sent again
+      - sha256 of .part is verified before it is renamed in place
+    Remote needs sha256sum & dd, as any linux based switch has.
+        scp = SCPConnect(host, 'image.bin', rpath = '/tmp', passwd = 'xyz',
+                         streams = 4)
+    """
+    conn_phase = 'copy'         # connect() of scp is whole copy
+    # copy time goes with file size, not host latency: a few small copies
+    # must not shrink the deadline of a big one, so conn_timeout is fixed
+    latency = None
+    chunk_size = 8388608        # bytes per chunk of a parallel transfer
+    io_size = 262144            # bytes per read/write of a chunk
+
     def __init__(self, host, lpath, rec = False, rpath = None, user = 'admin',
-                 passwd = None, logger = None):
+                 passwd = None, logger = None, port = None, streams = 0):
         self.lpath = lpath
         self.rpath = rpath
         self.recursive = rec
+        self.streams = streams
+        self.sessions = []          # ParamikoConnect per stream
+        self.sftps = []             # sftp client on each of above sessions
+        self.copied = []
+        self.skipped = []
+        self.nbytes = 0             # bytes sent by engine, resumed ones not
         super(SCPConnect, self).__init__(host, user = user, passwd = passwd,
-                                         timeout = 500)
+                                         port = port, logger = logger,
+                                         timeout = 500, conn_timeout = 500)
+
+    def connect_ok(self, ret):
+        # scp is done when it exits, with status 0 if copy went through
+        if ret is not True or self.handle is None:
+            return False
+        self.handle.close()
+        return self.handle.exitstatus == 0
 
     def connect(self, c = None):
+        if self.streams > 0:
+            return self.transfer()
         cmd = 'scp'
         if self.recursive is True:
             cmd += ' -r'
+        if self.port is not None and self.port != 22:
+            cmd += ' -P %s' % (self.port)
         cmd += ' %s %s@%s:' % (self.lpath, self.user, self.host)
-        if self.rpath is True:
+        if self.rpath is not None:
             cmd += '%s' % (self.rpath)
         return super(SCPConnect, self).connect(cmd)
 
-'''
-~/ws/repos/test-automation/versaQaAutomation/library/vmConnection/connect.py
-class ParamikoConnect(SwitchConnect):
-    def connect(self):
-        self.ssh = paramiko.SSHClient()
-        self.ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    def close(self):
+        for sess in self.sessions:
+            sess.close()
+        self.sessions = []
+        self.sftps = []
+        super(SCPConnect, self).close()
+
+    def open_streams(self, count):
+        # sessions are added as needed, earlier ones are reused across files
+        while len(self.sessions) < count:
+            sess = ParamikoConnect(self.host, user = self.user,
+                                   passwd = self.passwd, port = self.port,
+                                   logger = self.logger, quiet = True,
+                                   retry = 0, timeout = self.timeout,
+                                   conn_timeout = self.conn_timeout)
+            if sess.connected is False:
+                self.npasswd = sess.npasswd     # wrong password, no retry
+                return len(self.sessions) > 0
+            self.sessions.append(sess)
+            self.sftps.append(sess.client.open_sftp())
+        return True
+
+    def run(self, cmd):
+        status, out, err = self.sessions[0].exec_cmd(cmd)
+        return status, out
+
+    def file_list(self):
+        # (local path, remote path) of each file, dirs to create on remote
+        rpath = '.' if self.rpath is None else self.rpath
+        name = os.path.basename(os.path.normpath(self.lpath))
+        if self.run('test -d %s' % (shlex.quote(rpath)))[0] == 0:
+            rpath = posixpath.join(rpath, name)
+        if not os.path.isdir(self.lpath):
+            return [(self.lpath, rpath)], []
+        if self.recursive is not True:
+            raise IOError("%s is a directory, needs rec = True" % (self.lpath))
+        files = []
+        dirs = []
+        for root, subdirs, names in os.walk(self.lpath):
+            rel = os.path.relpath(root, self.lpath)
+            rdir = posixpath.normpath(posixpath.join(rpath, rel))
+            dirs.append(rdir)
+            for name in sorted(names):
+                files.append((os.path.join(root, name),
+                              posixpath.join(rdir, name)))
+        return files, dirs
+
+    def local_sums(self, path):
+        # sha256 of whole file & of each chunk, in one read of file
+        whole = hashlib.sha256()
+        chunks = []
+        with open(path, 'rb') as f:
+            while True:
+                part = hashlib.sha256()
+                left = self.chunk_size
+                while left > 0:
+                    data = f.read(min(self.io_size, left))
+                    if not data:
+                        break
+                    whole.update(data)
+                    part.update(data)
+                    left -= len(data)
+                if left == self.chunk_size:
+                    break
+                chunks.append(part.hexdigest())
+        return whole.hexdigest(), chunks
+
+    def remote_sum(self, path):
+        status, out = self.run('sha256sum %s' % (shlex.quote(path)))
+        return out.split()[0] if status == 0 and out.strip() else None
+
+    def remote_chunk_sums(self, path, nchunks):
+        # sha256 of each chunk of path on remote, as far as it was written
+        cmd = ('for i in $(seq 0 %d); do dd if=%s bs=%d skip=$i count=1 '
+               '2>/dev/null | sha256sum; done' %
+               (nchunks - 1, shlex.quote(path), self.chunk_size))
+        status, out = self.run(cmd)
+        return [line.split()[0] for line in out.splitlines() if line.strip()]
+
+    def send_chunks(self, lpath, part, todo):
+        # each stream picks next chunk from a shared queue till it is empty
+        jobs = queue.SimpleQueue()
+        for idx in todo:
+            jobs.put(idx)
+
+        def stream(sftp):
+            sent = 0
+            with open(lpath, 'rb') as fin, sftp.open(part, 'r+') as fout:
+                fout.set_pipelined(True)
+                while True:
+                    try:
+                        idx = jobs.get_nowait()
+                    except queue.Empty:
+                        return sent
+                    fin.seek(idx * self.chunk_size)
+                    fout.seek(idx * self.chunk_size)
+                    left = self.chunk_size
+                    while left > 0:
+                        data = fin.read(min(self.io_size, left))
+                        if not data:
+                            break
+                        fout.write(data)
+                        left -= len(data)
+                        sent += len(data)
+
+        sftps = self.sftps[:max(1, min(len(todo), len(self.sftps)))]
+        with ThreadPoolExecutor(max_workers = len(sftps),
+                                thread_name_prefix = 'scp') as pool:
+            self.nbytes += sum(pool.map(stream, sftps))
+
+    def send_file(self, lpath, rpath):
+        size = os.path.getsize(lpath)
+        whole, sums = self.local_sums(lpath)
+        if self.remote_sum(rpath) == whole:
+            self.logger.info("%s same as %s on host %s, skipped" %
+                             (lpath, rpath, self.host))
+            self.skipped.append(rpath)
+            return True
+        part = rpath + '.part'
+        todo = list(range(len(sums)))
+        if self.run('test -f %s' % (shlex.quote(part)))[0] == 0 and sums:
+            have = self.remote_chunk_sums(part, len(sums))
+            todo = [i for i in todo if i >= len(have) or have[i] != sums[i]]
+            self.logger.info("Resume %s on host %s, %d of %d chunks to send" %
+                             (part, self.host, len(todo), len(sums)))
+        self.open_streams(min(self.streams, max(len(todo), 1)))
+        with self.sftps[0].open(part, 'a'):
+            pass                            # create .part, keep what it has
+        self.sftps[0].truncate(part, size)
+        if todo:
+            self.send_chunks(lpath, part, todo)
+        if self.remote_sum(part) != whole:
+            # bad chunks get found & sent again by resume on next attempt
+            self.logger.error("Checksum mismatch for %s on host %s" %
+                              (part, self.host))
+            return False
+        status, out = self.run('chmod %o %s && mv -f %s %s' %
+                               (os.stat(lpath).st_mode & 0o7777,
+                                shlex.quote(part), shlex.quote(part),
+                                shlex.quote(rpath)))
+        if status != 0:
+            self.logger.error("Could not move %s in place on host %s: %s" %
+                              (part, self.host, out))
+            return False
+        self.copied.append(rpath)
+        return True
+
+    def transfer_files(self):
+        if paramiko is None:
+            self.logger.error("paramiko not installed, no parallel copy")
+            return False
+        if self.open_streams(1) is False:
+            return False
+        files, dirs = self.file_list()
+        if dirs:
+            self.run('mkdir -p %s' % (' '.join(shlex.quote(d) for d in dirs)))
+        for lpath, rpath in files:
+            if rpath in self.copied or rpath in self.skipped:
+                continue                    # done by an earlier attempt
+            if self.send_file(lpath, rpath) is False:
+                return False
+        return True
+
+    def transfer(self):
+        start = time.monotonic()
+        ok = False
+        for attempt in range(self.retry + 1):
+            if attempt > 0:
+                self.close()
+                delay = self.backoff(attempt)
+                self.logger.info("Retry copy to host %s in %.1fs" %
+                                 (self.host, delay))
+                time.sleep(delay)
+            try:
+                ok = self.transfer_files()
+            except (IOError, OSError, EOFError, socket.timeout,
+                    paramiko.SSHException) as e:
+                self.logger.error("Error %s copying to host %s" % (e, self.host))
+                ok = False
+            if ok is True or self.npasswd > 2:
+                break
+        secs = time.monotonic() - start
+        self.observe(self.conn_phase, start)
+        self.logger.info("Copy to host %s %s: %d copied, %d skipped, "
+                         "%.1f MB in %.1fs" %
+                         (self.host, 'done' if ok else 'failed',
+                          len(self.copied), len(self.skipped),
+                          self.nbytes / 1e6, secs))
+        self.close()
+        return ok
+
+class AsyncSSHConnect(SSHConnect):
+    """
+    asyncio flavour of SSHConnect with same connect/expect/send_line/send_exp
+    contract. expect() waits on pexpect's async_ mode, so one event loop can
+    drive thousands of logins and cmds without a thread per host. Login is
+    not done from __init__(), await connect() instead (pexpect >= 4.9 needed
+    on python 3.11+, older async_ mode uses removed asyncio.coroutine):
+        sess = AsyncSSHConnect(host, user = 'admin', passwd = 'xyz')
+        if await sess.connect():
+            await sess.send_exp('uptime')
+    """
+    autoconnect = False
+
+    @staticmethod
+    def supported():
+        # pexpect < 4.9 async_ mode uses asyncio.coroutine, gone in 3.11
+        if hasattr(asyncio, 'coroutine'):
+            return True
+        ver = tuple(int(v) for v in re.findall(r'\d+', pexpect.__version__)[:2])
+        return ver >= (4, 9)
+
+    def spawn(self, cmd = None):
+        if super(AsyncSSHConnect, self).spawn(cmd) is False:
+            return False
+        # pexpect sleeps before each send, which would stall the whole loop
+        self.handle.delaybeforesend = None
+        return True
+
+    async def aclose(self):
+        # close() sleeps while terminating child, keep it off event loop
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+    async def connect(self, cmd = None):
+        ok = False
+        if not self.supported():
+            self.logger.error("pexpect %s async mode needs pexpect >= 4.9 on "
+                              "python %d.%d, not connecting to host %s" %
+                              (pexpect.__version__, sys.version_info[0],
+                               sys.version_info[1], self.host))
+            self.connected = False
+            return False
+        for attempt in range(self.retry + 1):
+            if attempt > 0:
+                await self.aclose()
+                delay = self.backoff(attempt)
+                self.logger.info("Retry host %s in %.1fs" % (self.host, delay))
+                await asyncio.sleep(delay)
+            start = time.monotonic()
+            if self.spawn(cmd) is False:
+                continue
+            ret = await self.expect(timeout = self.conn_tmo())
+            if self.connect_done(attempt, ret, start) is True:
+                ok = self.connect_ok(ret)
+                break
+        self.connected = ok
+        return ok
+
+    async def probe(self, timeout = 5, isvsh = False):
+        if not self.is_up():
+            return False
+        if self.send_line('') is False:
+            return False
+        return await self.expect(isvsh = isvsh, timeout = timeout) and \
+               self.is_up()
+
+    async def expect(self, expr = None, isvsh = False, no = False,
+                     timeout = None, idle = None):
+        pats = self.expect_pats(expr, isvsh)
+        deadline = time.monotonic() + (self.timeout if timeout is None
+                                       else timeout)
+        seen = len(self.handle.buffer)
+        start = time.monotonic()
+        while True:
+            idx = await self.handle.expect_list(pats,
+                                    timeout = self.expect_wait(deadline, idle),
+                                    async_ = True)
+            busy = self.expect_busy(idx, deadline, idle, seen)
+            if busy is not None:
+                seen = busy
+                continue
+            self.observe(self.exp_phase(idx, expr), start)
+            ret = self.expect_idx(idx, expr, no)
+            if self.idle_abort(idx, deadline, idle):
+                return await self.interrupt(isvsh)
+            if ret is not None:
+                return ret
+            start = time.monotonic()
+
+    async def interrupt(self, isvsh):
         try:
-            self.ssh.connect(hostname = self.host,
-                             port = self.port,
-                             username = self.user,
-                             password = self.passwd)
-            self.handle = self.ssh.get_transport()
-            self.handle.use_compression(True)
-            self.logger.info('ssh successful to %s@%s:%d' % (self.user,
-                                                             self.host,
-                                                             self.port))
+            cpats = self.interrupt_pats(isvsh)
+            return self.interrupted(await self.handle.expect_list(cpats,
+                                            timeout = self.intr_timeout,
+                                            async_ = True))
         except Exception as e:
-            self.handle = None
-            self.logger.error("Error " + e + " connecting to host " + self.host)
+            self.logger.info("Exception %s seen on interrupt on host %s" %
+                             (e, self.host))
             return False
 
+    async def send_exp(self, cmd, expr = None, isvsh = False, timeout = None,
+                       idle = False):
+        start = time.monotonic()
+        if self.send_line(cmd) is False:
+            return False
+        ret = await self.expect(expr = expr, isvsh = isvsh, timeout = timeout,
+                                idle = self.idle_tmo(idle))
+        self.observe('send_exp', start)
+        if ret is True and self.latency is not None:
+            self.latency.update(self.host, 'cmd', time.monotonic() - start)
+        return ret
+
+    def interact(self):
+        raise NotImplementedError("interact() needs a blocking SSHConnect")
+
+class ParamikoConnect(SSHConnect):
+    """
+    In-process SSH backend with SSHConnect interface, needs paramiko. One
+    authenticated transport per host, no ssh child & no pty scraping. Each
+    cmd runs on its own exec channel, so many can run in parallel over one
+    transport, and each comes back with clean stdout, stderr & exit status.
+    No prompt regex is involved, so expect() & send_line() are not there.
+        conn = ParamikoConnect(host, user = 'admin', passwd = 'xyz')
+        for cmd, status, out, err in conn.exec_many(['uptime', 'df -h']):
+            ...
+    """
+    def __init__(self, host, user = 'admin', passwd = None, method = None,
+                 port = None, timeout = 1500, retry = 2, logger = None,
+                 quiet = False, conn_timeout = 60, compress = False):
+        self.client = None
+        self.compress = compress
+        super(ParamikoConnect, self).__init__(host, user = user,
+                                              passwd = passwd, method = method,
+                                              port = port, timeout = timeout,
+                                              retry = retry, logger = logger,
+                                              quiet = quiet,
+                                              conn_timeout = conn_timeout)
+
+    def spawn(self, cmd = None):
+        if paramiko is None:
+            self.logger.error("paramiko not installed, no in-process ssh")
+            return False
+        self.logger.info("Attempt in-process ssh to %s@%s:%s" %
+                         (self.user, self.host, self.port))
+        start = time.monotonic()
+        tmo = self.conn_tmo()
+        self.client = paramiko.SSHClient()
+        # same as answering yes to host key question in SSHConnect.expect()
+        self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        try:
+            self.client.connect(hostname = self.host, port = self.port,
+                                username = self.user, password = self.passwd,
+                                timeout = tmo, banner_timeout = tmo,
+                                auth_timeout = tmo, compress = self.compress,
+                                allow_agent = self.passwd is None,
+                                look_for_keys = self.passwd is None)
+        except paramiko.AuthenticationException as e:
+            self.logger.info("Password rejected by host %s: %s" % (self.host, e))
+            self.npasswd = 3                # do not retry, see connect_done()
+            self.client.close()
+            return False
+        except (paramiko.SSHException, OSError, EOFError) as e:
+            self.logger.error("Error %s connecting to host %s" % (e, self.host))
+            self.client.close()
+            return False
+        self.handle = self.client.get_transport()
+        # small request/reply packets, do not let Nagle hold them back
+        self.handle.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.observe('spawn', start)
         return True
 
-    def send_expect(self, cmd, exp = None):
-        return False
-        if self.handle is None:
-            self.logger.info('no ssh session to %s@%s:%d' % (self.user,
-                                                             self.host,
-                                                             self.port))
+    def connect(self, cmd = None):
+        ok = False
+        for attempt in range(self.retry + 1):
+            if attempt > 0:
+                self.close()
+                delay = self.backoff(attempt)
+                self.logger.info("Retry host %s in %.1fs" % (self.host, delay))
+                time.sleep(delay)
+            self.npasswd = 0
+            start = time.monotonic()
+            ret = self.spawn()
+            if self.connect_done(attempt, ret, start) is True:
+                ok = self.connect_ok(ret)
+                break
+        return ok
+
+    def is_up(self):
+        return self.handle is not None and self.handle.is_active()
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+        self.client = None
+        self.handle = None
+
+    def open_channel(self, cmd, timeout = None, combine = False):
+        chan = self.handle.open_session(timeout = self.conn_tmo())
+        chan.settimeout(self.timeout if timeout is None else timeout)
+        # combined, stderr comes in stdout as it would on a pty
+        chan.set_combine_stderr(combine)
+        chan.exec_command(cmd)
+        return chan
+
+    def exec_cmd(self, cmd, timeout = None):
+        """
+        Run cmd on a new exec channel, returns (status, stdout, stderr).
+        status is None if cmd did not finish within timeout.
+        """
+        start = time.monotonic()
+        deadline = start + (self.timeout if timeout is None else timeout)
+        self.logger.info("Execute: %s" % (cmd))
+        try:
+            chan = self.open_channel(cmd, timeout)
+        except (paramiko.SSHException, OSError, EOFError) as e:
+            self.logger.info("Exception %s seen for exec of %s on host %s" %
+                             (e, cmd, self.host))
+            return None, '', ''
+        out = []
+        err = []
+        status = None
+        try:
+            # drain both, a full stderr window would stall stdout otherwise.
+            # Exit status can come in before last of output, read till EOF.
+            while time.monotonic() < deadline:
+                if chan.recv_ready():
+                    out.append(chan.recv(65536))
+                elif chan.recv_stderr_ready():
+                    err.append(chan.recv_stderr(65536))
+                elif chan.eof_received or chan.closed:
+                    break
+                else:
+                    select.select([chan], [], [],
+                                  min(1, max(deadline - time.monotonic(), 0)))
+            # status follows EOF
+            if chan.status_event.wait(max(deadline - time.monotonic(), 0)):
+                status = chan.recv_exit_status()
+            if status is None:
+                self.logger.info("exec timeout for cmd %s on host %s" %
+                                 (cmd, self.host))
+        except (socket.timeout, paramiko.SSHException, OSError) as e:
+            self.logger.info("Exception %s seen for exec of %s on host %s" %
+                             (e, cmd, self.host))
+        finally:
+            chan.close()
+        self.observe('exec', start)
+        if status is not None and self.latency is not None:
+            self.latency.update(self.host, 'cmd', time.monotonic() - start)
+        return (status, b''.join(out).decode(errors = 'replace'),
+                b''.join(err).decode(errors = 'replace'))
+
+    def exec_many(self, cmds, jobs = 8, timeout = None):
+        # cmds run in parallel channels over one transport, results in order
+        with ThreadPoolExecutor(max_workers = max(1, jobs),
+                                thread_name_prefix = 'exec') as pool:
+            res = list(pool.map(lambda cmd: self.exec_cmd(cmd, timeout), cmds))
+        return [(cmd,) + r for cmd, r in zip(cmds, res)]
+
+    def send_exp(self, cmd, expr = None, isvsh = False, timeout = None,
+                 idle = False):
+        # idle is moot, each cmd has its own channel to give up on
+        self.last_cmd = cmd
+        start = time.monotonic()
+        status, out, err = self.exec_cmd(cmd, timeout)
+        self.observe('send_exp', start)
+        self.cli_out = out
+        self.err_out = err
+        self.exit_status = status
+        return status is not None
+
+    def send_batch(self, cmds, isvsh = False, timeout = None):
+        # exec channels are already independent, no markers needed
+        return [(cmd, status, out + err) for cmd, status, out, err in
+                self.exec_many(cmds, timeout = timeout)]
+
+    def send_stream(self, cmd, isvsh = False, lines = False, spill = None,
+                    chunk = 4096, window = 1024, timeout = None):
+        # output of exec channel ends at channel close, no prompt to look for
+        self.stream_ok = False
+        self.last_cmd = cmd
+        # stderr is not read here, left apart it would fill its window
+        chan = self.open_channel(cmd, timeout, combine = True)
+        decoder = codecs.getincrementaldecoder('utf-8')(errors = 'replace')
+        fout = open(spill, 'wb') if spill is not None else None
+        part = ''
+        try:
+            while True:
+                data = chan.recv(chunk)
+                if fout is not None:
+                    fout.write(data)
+                text = decoder.decode(data, not data)
+                if lines is True:
+                    text = part + text
+                    out = text.split('\n')
+                    part = out.pop() if data else ''
+                    if not data and out and out[-1] == '':
+                        out.pop()
+                    for line in out:
+                        yield line[:-1] if line.endswith('\r') else line
+                elif text:
+                    yield text
+                if not data:
+                    break
+            self.exit_status = chan.recv_exit_status()
+            self.stream_ok = True
+        except socket.timeout:
+            self.logger.info("stream timeout for cmd %s on host %s" %
+                             (cmd, self.host))
+        finally:
+            chan.close()
+            if fout is not None:
+                fout.close()
+
+    def output(self):
+        return getattr(self, 'cli_out', '')
+
+    def probe(self, timeout = 5, isvsh = False):
+        # round trip on transport, without running anything on device
+        if not self.is_up():
             return False
+        try:
+            chan = self.handle.open_session(timeout = timeout)
+            chan.close()
+        except (paramiko.SSHException, OSError, EOFError):
+            return False
+        return True
+
+    def expect(self, *args, **kwargs):
+        raise NotImplementedError("no prompt on exec channels, use send_exp()")
+
+    def send_line(self, cmd):
+        raise NotImplementedError("no prompt on exec channels, use send_exp()")
+
+    def interact(self):
+        raise NotImplementedError("interact() needs a pty based SSHConnect")
+
+class SSHPool():
+    """
+    Pool of live, logged-in SSHConnect sessions keyed by (method, user, host,
+    port). A session handed back with put() is reused by next get() of same
+    key, saving process spawn and login dialogue. Idle sessions are closed
+    after idle_tmo secs, and at most max_size sessions are open at a time.
+    """
+    def __init__(self, max_size = 32, idle_tmo = 300, probe_tmo = 5,
+                 logger = None, conn_cls = None):
+        self.conn_cls = SSHConnect if conn_cls is None else conn_cls
+        self.max_size = max_size
+        self.idle_tmo = idle_tmo
+        self.probe_tmo = probe_tmo
+        self.logger = logger if logger != None else globs.g_logger
+        self.cond = threading.Condition()
+        self.idle = {}          # key -> [(session, last used time), ...]
+        self.nsess = 0          # open sessions, idle + handed out
+
+    def key(self, host, user = 'admin', method = None, port = None):
+        return ('ssh' if method is None else method, user, host,
+                22 if port is None else port)
+
+    def check(self, sess):
+        # is_up() only catches dead process, probe catches wedged session
+        if sess.is_up() and sess.probe(timeout = self.probe_tmo):
+            return True
+        self.logger.info("Stale session to host %s, login again" % (sess.host))
+        sess.close()
+        sess.connected = sess.connect()
+        return sess.connected is not False and sess.is_up()
+
+    def drop_slot(self):
+        with self.cond:
+            self.nsess -= 1
+            self.cond.notify()
+
+    def drop(self, sess):
+        sess.close()
+        self.drop_slot()
+
+    def evict(self, now = None):
+        # close sessions idle for too long. Called with self.cond held.
+        now = time.time() if now is None else now
+        for key in list(self.idle.keys()):
+            live = []
+            for sess, used in self.idle[key]:
+                if now - used > self.idle_tmo:
+                    sess.close()
+                    self.nsess -= 1
+                else:
+                    live.append((sess, used))
+            if live:
+                self.idle[key] = live
+            else:
+                del self.idle[key]
+
+    def evict_lru(self):
+        # make room for new session by closing least recently used idle one
+        lru = None
+        for key, sessions in self.idle.items():
+            if lru is None or sessions[0][1] < lru[1]:
+                lru = (key, sessions[0][1])
+        if lru is None:
+            return False
+        sess, used = self.idle[lru[0]].pop(0)
+        if not self.idle[lru[0]]:
+            del self.idle[lru[0]]
+        sess.close()
+        self.nsess -= 1
+        return True
+
+    def get(self, host, user = 'admin', passwd = None, method = None,
+            port = None, **kwargs):
+        key = self.key(host, user, method, port)
+        while True:
+            with self.cond:
+                self.evict()
+                sessions = self.idle.get(key)
+                if sessions:
+                    sess = sessions.pop()[0]        # most recently used
+                    if not sessions:
+                        del self.idle[key]
+                else:
+                    sess = None
+                    while self.nsess >= self.max_size:
+                        if not self.evict_lru():
+                            self.cond.wait()        # wait for a put()/drop()
+                    self.nsess += 1
+            if sess is None:
+                break
+            if self.check(sess):
+                self.logger.debug("Reuse pooled session to host " + host)
+                return sess
+            self.drop(sess)
+
+        try:
+            sess = self.conn_cls(host, user = user, passwd = passwd,
+                                 method = method, port = port, **kwargs)
+        except Exception:
+            self.drop_slot()
+            raise
+        if sess.connected is False or not sess.is_up():
+            self.drop(sess)
+            return None
+        return sess
+
+    def put(self, sess):
+        if not sess.is_up():
+            self.drop(sess)
+            return
+        key = self.key(sess.host, sess.user, sess.method, sess.port)
+        with self.cond:
+            self.idle.setdefault(key, []).append((sess, time.time()))
+            self.cond.notify()
+
+    @contextmanager
+    def session(self, host, **kwargs):
+        sess = self.get(host, **kwargs)
+        if sess is None:
+            raise ConnectionError("Error connecting to host %s" % (host))
+        try:
+            yield sess
+        except Exception:
+            self.drop(sess)         # state of session unknown, do not reuse
+            raise
+        self.put(sess)
+
+    def close_all(self):
+        with self.cond:
+            for sessions in self.idle.values():
+                for sess, used in sessions:
+                    sess.close()
+                    self.nsess -= 1
+            self.idle = {}
+            self.cond.notify_all()
+
+class SSHFanout():
+    """
+    Run same set of cmds on many hosts, each over its own SSHConnect session.
+    Sessions run on a bounded pool of worker threads, so total run time is
+    bound by slowest host rather than sum of all hosts.
+    """
+    def __init__(self, hosts, cmds, user = 'admin', passwd = None,
+                 method = None, port = None, jobs = 16, isvsh = False,
+                 timeout = 1500, batch = False, logger = None,
+                 conn_cls = None):
+        self.conn_cls = SSHConnect if conn_cls is None else conn_cls
+        self.hosts = hosts
+        self.cmds = cmds if cmds is not None else []
+        self.user = user
+        self.passwd = passwd
+        self.method = method
+        self.port = port
+        self.jobs = max(1, jobs)
+        self.isvsh = isvsh
+        self.timeout = timeout
+        self.batch = batch              # pipeline cmds with send_batch()
+        self.logger = logger if logger != None else globs.g_logger
+        self.results = {}
+
+    def run_host(self, host):
+        res = {'host': host, 'ok': False, 'cli_out': [], 'err': None}
+        start = time.time()
+        conn = None
+        try:
+            conn = self.conn_cls(host, user = self.user, passwd = self.passwd,
+                                 method = self.method, port = self.port,
+                                 timeout = self.timeout, logger = self.logger,
+                                 quiet = True)
+            if conn.connected is False or not conn.is_up():
+                res['err'] = 'connect failed'
+            elif self.batch is True:
+                out = conn.send_batch(self.cmds, isvsh = self.isvsh)
+                res['cli_out'] = [(cmd, text) for cmd, status, text in out]
+                lost = [cmd for cmd, status, text in out if status is None]
+                res['ok'] = not lost
+                if lost:
+                    res['err'] = 'no output for cmd: %s' % (lost[0])
+            else:
+                res['ok'] = True
+                for cmd in self.cmds:
+                    ok = conn.send_exp(cmd, isvsh = self.isvsh)
+                    res['cli_out'].append((cmd, conn.output()))
+                    if ok is False:
+                        res['ok'] = False
+                        res['err'] = 'cmd failed: %s' % (cmd)
+                        break
+        except Exception as e:
+            res['ok'] = False
+            res['err'] = 'exception: %s' % (e)
+        finally:
+            if conn is not None:
+                conn.close()
+        res['secs'] = time.time() - start
+        return res
+
+    async def run_host_async(self, host, sem):
+        res = {'host': host, 'ok': False, 'cli_out': [], 'err': None}
+        async with sem:
+            start = time.time()
+            conn = None
+            try:
+                conn = AsyncSSHConnect(host, user = self.user,
+                                       passwd = self.passwd,
+                                       method = self.method, port = self.port,
+                                       timeout = self.timeout,
+                                       logger = self.logger, quiet = True)
+                if await conn.connect() is False or not conn.is_up():
+                    res['err'] = 'connect failed'
+                else:
+                    res['ok'] = True
+                    for cmd in self.cmds:
+                        ok = await conn.send_exp(cmd, isvsh = self.isvsh)
+                        res['cli_out'].append((cmd, conn.output()))
+                        if ok is False:
+                            res['ok'] = False
+                            res['err'] = 'cmd failed: %s' % (cmd)
+                            break
+            except Exception as e:
+                res['ok'] = False
+                res['err'] = 'exception: %s' % (e)
+            finally:
+                if conn is not None:
+                    await conn.aclose()
+            res['secs'] = time.time() - start
+        self.results[host] = res
+        self.logger.info("Host %s done: %s" %
+                         (host, 'ok' if res['ok'] else res['err']))
+        return res
+
+    async def gather_async(self):
+        sem = asyncio.Semaphore(self.jobs)
+        await asyncio.gather(*[self.run_host_async(h, sem) for h in self.hosts])
+
+    def run_async(self):
+        # same as run(), but on one event loop instead of a thread per host
+        if not AsyncSSHConnect.supported():
+            self.logger.info("pexpect %s has no working async mode here "
+                             "(needs >= 4.9), using threads" %
+                             (pexpect.__version__))
+            return self.run()
+        self.logger.info("Async fan-out %d cmds to %d hosts, %d at a time" %
+                         (len(self.cmds), len(self.hosts), self.jobs))
+        asyncio.run(self.gather_async())
+        return self.results
+
+    def run(self):
+        self.logger.info("Fan-out %d cmds to %d hosts, %d at a time" %
+                         (len(self.cmds), len(self.hosts), self.jobs))
+        with ThreadPoolExecutor(max_workers = self.jobs,
+                                thread_name_prefix = 'fanout') as pool:
+            futs = [pool.submit(self.run_host, h) for h in self.hosts]
+            for fut in as_completed(futs):
+                res = fut.result()
+                self.results[res['host']] = res
+                self.logger.info("Host %s done: %s" %
+                                 (res['host'], 'ok' if res['ok'] else res['err']))
+        return self.results
+
+    def report(self, outputs = True):
+        # print in input order of hosts, not completion order
+        nfail = 0
+        if outputs is True:
+            for host in self.hosts:
+                for cmd, out in self.results[host]['cli_out']:
+                    print("===== %s: %s" % (host, cmd))
+                    print(out)
+        print("%-32s %-6s %8s  %s" % ('HOST', 'STATUS', 'SECS', 'ERROR'))
+        for host in self.hosts:
+            res = self.results[host]
+            nfail += 0 if res['ok'] else 1
+            print("%-32s %-6s %8.2f  %s" % (host, 'ok' if res['ok'] else 'FAIL',
+                                            res['secs'], res['err'] or ''))
+        print("%d hosts, %d ok, %d failed" % (len(self.hosts),
+                                              len(self.hosts) - nfail, nfail))
+        return nfail
+
+class SCPDistribute():
+    """
+    Copy one artifact (file, or dir with rec = True) into rpath dir of many
+    hosts, at most jobs copies going out of this machine at a time. With
+    relay > 0, every host that has the artifact also forwards it to up to
+    relay peers at a time (scp run on that host), so seeded hosts multiply
+    each round and total time grows with log of number of hosts, not with
+    it. A host whose relay copy failed is tried again from another source,
+    and last directly from this machine before it is given up on. A relay
+    is not used again once its copies to relay_fails different hosts have
+    failed, as one bad target says little about the relay. Same user/passwd
+    for every host.
+        dist = SCPDistribute(hosts, 'image.bin', rpath = '/bootflash',
+                             passwd = 'xyz', jobs = 4, relay = 2)
+        dist.run()
+        nfail = dist.report()
+    """
+    max_tries = 3               # relay copies of one host before going direct
+    relay_fails = 2             # failed targets before a relay is dropped
+
+    def __init__(self, hosts, lpath, rpath = None, rec = False,
+                 user = 'admin', passwd = None, port = None, jobs = 4,
+                 relay = 0, streams = 0, timeout = 3600, logger = None):
+        self.hosts = hosts
+        self.lpath = lpath
+        self.rpath = '.' if rpath is None else rpath
+        self.recursive = rec
+        self.user = user
+        self.passwd = passwd
+        self.port = 22 if port is None else port
+        self.jobs = max(1, jobs)
+        self.relay = relay
+        self.streams = streams
+        self.timeout = timeout
+        self.logger = logger if logger != None else globs.g_logger
+        # relays run a few scp each, keep their logins for next one
+        self.pool = SSHPool(max_size = max(32, len(hosts)), logger = self.logger)
+        self.results = {}
+
+    def copy_direct(self, host):
+        conn = SCPConnect(host, self.lpath, rec = self.recursive,
+                          rpath = self.rpath, user = self.user,
+                          passwd = self.passwd, port = self.port,
+                          logger = self.logger, streams = self.streams)
+        if conn.connected is not True:
+            return False, 'copy failed'
+        return True, None
+
+    def copy_relay(self, src, host):
+        # scp from src to host, src answers host key & password of its scp
+        name = os.path.basename(os.path.normpath(self.lpath))
+        cmd = 'scp%s -P %d %s %s@%s:%s' % (' -r' if self.recursive else '',
+                                          self.port,
+                                          shlex.quote(posixpath.join(self.rpath,
+                                                                     name)),
+                                          self.user, host,
+                                          shlex.quote(self.rpath))
+        with self.pool.session(src, user = self.user, passwd = self.passwd,
+                               port = self.port, quiet = True,
+                               timeout = self.timeout) as conn:
+            if conn.send_exp(cmd, timeout = self.timeout) is not True:
+                return False, 'scp from %s did not finish' % (src)
+            if conn.send_exp('echo "rc=$?"') is not True:
+                return False, 'no exit status of scp from %s' % (src)
+            rc = re.search(r'rc=(\d+)', conn.output())
+            if rc is None or rc.group(1) != '0':
+                return False, 'scp from %s failed (%s)' % \
+                    (src, rc.group(1) if rc else '?')
+        return True, None
+
+    def copy_one(self, host, src):
+        start = time.time()
+        try:
+            if src is None:
+                ok, err = self.copy_direct(host)
+            else:
+                ok, err = self.copy_relay(src, host)
+        except Exception as e:
+            ok, err = False, 'exception: %s' % (e)
+        return ok, err, time.time() - start
+
+    def pick_source(self, slots, skip = ()):
+        # seeded hosts first, to spare uplink of this machine (None)
+        for src, free in slots.items():
+            if src is not None and free > 0 and src not in skip:
+                return src
+        return None if slots[None] > 0 else False
+
+    def relay_failed(self, slots, fails, src, host):
+        # drop relay only if it fails for more than one target
+        fails.setdefault(src, set()).add(host)
+        if len(fails[src]) >= self.relay_fails and src in slots:
+            self.logger.info("Relay %s failed for %d hosts, not used again" %
+                             (src, len(fails[src])))
+            slots.pop(src)
+
+    def run(self):
+        self.logger.info("Distribute %s to %d hosts, %d direct, relay %d" %
+                         (self.lpath, len(self.hosts), self.jobs, self.relay))
+        start = time.time()
+        pending = list(reversed(self.hosts))
+        local = []                          # hosts to copy to from here only
+        slots = {None: self.jobs}           # free copy slots of each source
+        tries = dict.fromkeys(self.hosts, 0)
+        fails = {}                          # relay -> hosts it failed for
+        running = {}
+        ndone = 0
+        with ThreadPoolExecutor(max_workers = min(256, self.jobs + self.relay *
+                                                  len(self.hosts)),
+                                thread_name_prefix = 'dist') as pool:
+            while pending or local or running:
+                while local and slots[None] > 0:
+                    host = local.pop()
+                    slots[None] -= 1
+                    tries[host] += 1
+                    fut = pool.submit(self.copy_one, host, None)
+                    running[fut] = (host, None)
+                while pending:
+                    host = pending[-1]
+                    bad = [r for r, tgts in fails.items() if host in tgts]
+                    src = self.pick_source(slots, bad)
+                    if src is False:
+                        break
+                    pending.pop()
+                    slots[src] -= 1
+                    tries[host] += 1
+                    running[pool.submit(self.copy_one, host, src)] = (host, src)
+                done, _ = wait(running, return_when = FIRST_COMPLETED)
+                for fut in done:
+                    host, src = running.pop(fut)
+                    ok, err, secs = fut.result()
+                    if src in slots:
+                        slots[src] += 1
+                    if ok is True and self.relay > 0:
+                        slots[host] = self.relay
+                    elif ok is False and src is not None:
+                        self.relay_failed(slots, fails, src, host)
+                    # direct copy already retries & resumes inside SCPConnect
+                    if ok is False and src is not None:
+                        retry = local if tries[host] >= self.max_tries \
+                                else pending
+                        self.logger.info("Copy to %s via %s failed: %s, "
+                                         "retry%s" % (host, src, err,
+                                                      ' from local' if retry
+                                                      is local else ''))
+                        retry.append(host)
+                        continue
+                    ndone += 1
+                    self.results[host] = {'ok': ok, 'err': err, 'secs': secs,
+                                          'via': src or 'local',
+                                          'tries': tries[host]}
+                    self.logger.info("[%d/%d] %s %s via %s in %.1fs%s" %
+                                     (ndone, len(self.hosts), host,
+                                      'done' if ok else 'FAILED',
+                                      src or 'local', secs,
+                                      ', ' + err if err else ''))
+        self.pool.close_all()
+        self.secs = time.time() - start
+        return self.results
+
+    def report(self):
+        # print in input order of hosts, not completion order
+        nfail = 0
+        print("%-32s %-6s %8s %5s  %-24s %s" % ('HOST', 'STATUS', 'SECS',
+                                                'TRIES', 'VIA', 'ERROR'))
+        for host in self.hosts:
+            res = self.results[host]
+            nfail += 0 if res['ok'] else 1
+            print("%-32s %-6s %8.2f %5d  %-24s %s" %
+                  (host, 'ok' if res['ok'] else 'FAIL', res['secs'],
+                   res['tries'], res['via'], res['err'] or ''))
+        print("%d hosts, %d ok, %d failed in %.1fs" %
+              (len(self.hosts), len(self.hosts) - nfail, nfail, self.secs))
+        return nfail
 
-        sess = self.handle.open_session()
-        sess.set_combine_stderr(True)       # stdout + stderr
-        sess.get_pty()
-        print(cmd, sess)
-        stdin, stdout = sess.exec_command(cmd)
-        for line in stdout.readlines():
-            print(line.strip())
-'''
 '''
             prompt = self.root_prompt if self.user == 'root' else self.prompt
 